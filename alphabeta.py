@@ -0,0 +1,336 @@
+import argparse
+import time
+
+import numpy as np
+
+from chess import ChessGame, TranspositionTable, move_to_uci
+
+# Material in centipawns by piece code.
+PIECE_VALUES = {1: 100, 2: 500, 3: 320, 4: 330, 5: 900, 6: 0}
+
+# Piece-square bonuses for White, one row of the board per line starting from row 0 (White's back rank), each line
+# running from the a-file to the h-file. The board's columns run the other way (the a-file is column 7), so
+# _square_scores mirrors the column when reading them.
+PAWN_SQUARES = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+ROOK_SQUARES = (
+    0, 0, 0, 5, 5, 0, 0, 0,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+)
+KNIGHT_SQUARES = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_SQUARES = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+QUEEN_SQUARES = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+)
+KING_SQUARES = (
+    20, 30, 10, 0, 0, 10, 30, 20,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+)
+PIECE_SQUARES = {1: PAWN_SQUARES, 2: ROOK_SQUARES, 3: KNIGHT_SQUARES, 4: BISHOP_SQUARES, 5: QUEEN_SQUARES,
+                 6: KING_SQUARES}
+
+
+def _square_scores():
+    """
+    Builds a (13, 64) table of the score of each piece code (indexed code + 6) on each square, from White's view.
+    Black's tables are White's mirrored top to bottom.
+    """
+    scores = np.zeros((13, 64), dtype=np.int64)
+    for piece, table in PIECE_SQUARES.items():
+        for sq in range(64):
+            row, col = divmod(sq, 8)
+            scores[piece + 6][sq] = PIECE_VALUES[piece] + table[row * 8 + 7 - col]
+            scores[6 - piece][sq] = -(PIECE_VALUES[piece] + table[(7 - row) * 8 + 7 - col])
+    return scores
+
+
+SQUARE_SCORES = _square_scores()
+SQUARES = np.arange(64)
+MATE_SCORE = 100000
+INFINITY = 1000000
+# Scores at least this far from zero are mates, whose distance depends on the ply they are found at.
+MATE_BOUND = MATE_SCORE - 1000
+
+# Transposition table bounds.
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def evaluate(game):
+    """
+    Returns the material and piece-square score of the position in centipawns, for the side to move.
+    """
+    score = int(SQUARE_SCORES[game.board.reshape(-1) + 6, SQUARES].sum())
+    return score if game.to_move == 'White' else -score
+
+
+def score_to_table(score, ply):
+    """
+    Converts a mate score relative to the root into one relative to the node at ply, for the transposition table.
+    """
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """
+    Converts a mate score from the transposition table back to one relative to the root, at ply.
+    """
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class AlphaBeta:
+    """
+    Negamax alpha-beta search over ChessGame with iterative deepening, a transposition table, quiescence search on
+    captures, and moves ordered by the table's best move, captures (most valuable victim first), killer moves and
+    the history heuristic.
+    Each completed iteration is recorded in self.iterations with its depth, score, nodes, seconds, nodes per second
+    and principal variation.
+    """
+
+    def __init__(self, max_depth=4, time_limit=None, table_size=1 << 18, on_iteration=None):
+        '''
+        max_depth: deepest iteration to search
+        time_limit: seconds per search, None for no limit; the best move of the last completed iteration is played
+        table_size: number of transposition table slots
+        on_iteration: optional callable given each iteration's dict as it completes
+        '''
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.table = TranspositionTable(table_size)
+        self.on_iteration = on_iteration
+        self.iterations = []
+        self.nodes = 0
+
+    def __call__(self, game, rng=None):
+        """
+        Returns the best move for the side to move, so a searcher can be used as a self-play policy.
+        """
+        return self.search(game)
+
+    def search(self, game, max_depth=None, time_limit=None):
+        """
+        Searches the position of game and returns the best move, or None if there are no legal moves.
+        The game is left as it was.
+        """
+        max_depth = self.max_depth if max_depth is None else max_depth
+        time_limit = self.time_limit if time_limit is None else time_limit
+        moves = game.return_legal_moves()
+        if not moves:
+            return None
+        self.start = time.perf_counter()
+        self.deadline = None if time_limit is None else self.start + time_limit
+        self.nodes = 0
+        self.iterations = []
+        self.killers = [[None, None] for _ in range(max_depth + 64)]
+        self.history = {'White': [0] * 4096, 'Black': [0] * 4096}
+        base = len(game.undo_stack)
+        best = moves[0]
+
+        for depth in range(1, max_depth + 1):
+            self.pv = [[] for _ in range(depth + 64)]
+            try:
+                score = self._negamax(game, depth, 0, -INFINITY, INFINITY)
+            except SearchTimeout:
+                while len(game.undo_stack) > base:
+                    game.pop()
+                break
+            if self.pv[0]:
+                best = self.pv[0][0]
+            elapsed = time.perf_counter() - self.start
+            iteration = {'depth': depth, 'score': score, 'nodes': self.nodes, 'seconds': elapsed,
+                         'nps': self.nodes / max(elapsed, 1e-9), 'pv': list(self.pv[0])}
+            self.iterations.append(iteration)
+            if self.on_iteration is not None:
+                self.on_iteration(iteration)
+            if abs(score) >= MATE_SCORE - 64:
+                break
+        return best
+
+    def _check_time(self):
+        if self.deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def _order(self, game, moves, best, ply):
+        """
+        Returns moves sorted best first.
+        """
+        board = game.board
+        killers = self.killers[ply]
+        history = self.history[game.to_move]
+        scores = []
+        for move in moves:
+            if move == best:
+                score = 1 << 30
+            else:
+                victim = board[move[2]][move[3]]
+                if victim:
+                    score = (1 << 20) + 10 * PIECE_VALUES.get(abs(int(victim)), 0) + 1000 \
+                        - PIECE_VALUES.get(abs(int(board[move[0]][move[1]])), 0) // 10
+                elif move == killers[0]:
+                    score = 1 << 19
+                elif move == killers[1]:
+                    score = (1 << 19) - 1
+                else:
+                    score = history[(move[0] * 8 + move[1]) * 64 + move[2] * 8 + move[3]]
+            scores.append(score)
+        return [move for _, move in sorted(zip(scores, moves), key=lambda pair: -pair[0])]
+
+    def _negamax(self, game, depth, ply, alpha, beta):
+        self.nodes += 1
+        self._check_time()
+        self.pv[ply] = []
+        # A position that already occurred in the game or on the search path is scored as a draw, as is one where
+        # the fifty-move rule applies.
+        if ply and (game.position_counts[game.zobrist] > 1 or game.halfmove_clock >= 100):
+            return 0
+        if depth <= 0:
+            return self._quiescence(game, ply, alpha, beta)
+
+        key = game.zobrist
+        entry = self.table.get_value(key)
+        best_move = None
+        if entry is not None:
+            entry_depth, entry_score, bound, best_move = entry
+            entry_score = score_from_table(entry_score, ply)
+            if ply and entry_depth >= depth:
+                if bound == EXACT or (bound == LOWER and entry_score >= beta) or \
+                        (bound == UPPER and entry_score <= alpha):
+                    if best_move is not None:
+                        self.pv[ply] = [best_move]
+                    return entry_score
+
+        moves = game.return_legal_moves()
+        if not moves:
+            return -MATE_SCORE + ply if game.in_check(game.to_move) else 0
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        for move in self._order(game, moves, best_move, ply):
+            game.push(move)
+            score = -self._negamax(game, depth - 1, ply + 1, -beta, -alpha)
+            game.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.pv[ply] = [move] + self.pv[ply + 1]
+            if alpha >= beta:
+                if not game.board[move[2]][move[3]]:
+                    killers = self.killers[ply]
+                    if move != killers[0]:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    self.history[game.to_move][(move[0] * 8 + move[1]) * 64 + move[2] * 8 + move[3]] += depth * depth
+                break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store_value(key, (depth, score_to_table(best_score, ply), bound, best_move), depth)
+        return best_score
+
+    def _quiescence(self, game, ply, alpha, beta):
+        """
+        Searches captures only until the position is quiet, so the evaluation is never taken mid-exchange.
+        """
+        moves = game.return_legal_moves()
+        if not moves:
+            return -MATE_SCORE + ply if game.in_check(game.to_move) else 0
+        stand_pat = evaluate(game)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        board = game.board
+        captures = [move for move in moves if board[move[2]][move[3]]]
+        for move in self._order(game, captures, None, ply):
+            self.nodes += 1
+            self._check_time()
+            game.push(move)
+            score = -self._quiescence(game, ply + 1, -beta, -alpha)
+            game.pop()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search a position with iterative deepening alpha-beta.")
+    parser.add_argument('--fen', help="position to search (default: the start position)")
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--time', type=float, default=None, help="seconds to search for")
+    args = parser.parse_args(argv)
+
+    game = ChessGame.from_fen(args.fen) if args.fen else ChessGame()
+
+    def report(iteration):
+        print("depth %d  score %6d  nodes %8d  %6.2fs  %7.0f nodes/s  pv %s" % (
+            iteration['depth'], iteration['score'], iteration['nodes'], iteration['seconds'], iteration['nps'],
+            ' '.join(move_to_uci(move) for move in iteration['pv'])))
+
+    move = AlphaBeta(args.depth, args.time, on_iteration=report).search(game)
+    print("best move: %s" % (move_to_uci(move) if move else 'none'))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,567 @@
+import random
+
 import numpy as np
 
 
+def _step_table(offsets):
+    """
+    Returns, for every square index (row * 8 + col), the sorted tuple of squares reachable by a single step.
+    """
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        targets = []
+        for d_row, d_col in offsets:
+            r, c = row + d_row, col + d_col
+            if 0 <= r < 8 and 0 <= c < 8:
+                targets.append(r * 8 + c)
+        table.append(tuple(sorted(targets)))
+    return tuple(table)
+
+
+def _ray_table(directions):
+    """
+    Returns, for every square index, a tuple of rays. Each ray lists the squares in order moving away from the square.
+    """
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        rays = []
+        for d_row, d_col in directions:
+            ray = []
+            r, c = row + d_row, col + d_col
+            while 0 <= r < 8 and 0 <= c < 8:
+                ray.append(r * 8 + c)
+                r, c = r + d_row, c + d_col
+            if ray:
+                rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return tuple(table)
+
+
+# Move tables, built once at import time. Squares are indexed row * 8 + col.
+KNIGHT_OFFSETS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+KING_OFFSETS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+KNIGHT_TARGETS = _step_table(KNIGHT_OFFSETS)
+KING_TARGETS = _step_table(KING_OFFSETS)
+# Diagonal capture squares of a pawn, keyed by the sign of the pawn (1 = White, -1 = Black).
+PAWN_ATTACKS = {1: _step_table(((1, -1), (1, 1))), -1: _step_table(((-1, -1), (-1, 1)))}
+ROOK_RAYS = _ray_table(ROOK_DIRECTIONS)
+BISHOP_RAYS = _ray_table(BISHOP_DIRECTIONS)
+QUEEN_RAYS = tuple(ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64))
+SLIDER_RAYS = {2: ROOK_RAYS, 4: BISHOP_RAYS, 5: QUEEN_RAYS}
+
+
+def _mask(squares):
+    """
+    Returns the bitboard with a bit set for every square in squares.
+    """
+    bits = 0
+    for sq in squares:
+        bits |= 1 << sq
+    return bits
+
+
+def _direction_masks(d_row, d_col):
+    """
+    Returns, for every square index, the bitboard of the ray leaving the square in one direction.
+    """
+    rays = _ray_table(((d_row, d_col),))
+    return tuple(_mask(rays[sq][0]) if rays[sq] else 0 for sq in range(64))
+
+
+# Bitboard versions of the move tables. Bit n of a bitboard is the square with index n.
+KNIGHT_MASKS = tuple(_mask(targets) for targets in KNIGHT_TARGETS)
+KING_MASKS = tuple(_mask(targets) for targets in KING_TARGETS)
+PAWN_MASKS = {sign: tuple(_mask(targets) for targets in table) for sign, table in PAWN_ATTACKS.items()}
+# Rays are split by whether they run towards higher or lower square indices, since that decides which end of
+# the blockers is nearest.
+ROOK_UP_MASKS = tuple(_direction_masks(d_row, d_col) for d_row, d_col in ((1, 0), (0, 1)))
+ROOK_DOWN_MASKS = tuple(_direction_masks(d_row, d_col) for d_row, d_col in ((-1, 0), (0, -1)))
+BISHOP_UP_MASKS = tuple(_direction_masks(d_row, d_col) for d_row, d_col in ((1, 1), (1, -1)))
+BISHOP_DOWN_MASKS = tuple(_direction_masks(d_row, d_col) for d_row, d_col in ((-1, 1), (-1, -1)))
+
+
+# Zobrist keys. They come from a fixed seed so a position hashes the same in every process.
+_zobrist_random = random.Random(0x5EED)
+# Indexed by piece code + 6 then square. Empty squares (index 6) hash to 0.
+ZOBRIST_PIECES = tuple(tuple(0 if index == 6 else _zobrist_random.getrandbits(64) for _ in range(64))
+                       for index in range(13))
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = tuple(_zobrist_random.getrandbits(64) for _ in range(4))
+ZOBRIST_EN_PASSANT = tuple(_zobrist_random.getrandbits(64) for _ in range(8))
+
+
+def zobrist_state(to_move, castling, en_passant):
+    """
+    Returns the part of the Zobrist key that does not depend on the pieces.
+    """
+    key = ZOBRIST_BLACK_TO_MOVE if to_move == 'Black' else 0
+    for flag, flag_key in zip(castling, ZOBRIST_CASTLING):
+        if flag:
+            key ^= flag_key
+    if en_passant[0] == 1:
+        key ^= ZOBRIST_EN_PASSANT[en_passant[1]]
+    return key
+
+
+def zobrist_hash(board, to_move, castling, en_passant):
+    """
+    Computes the Zobrist key of a position from scratch.
+    """
+    key = zobrist_state(to_move, castling, en_passant)
+    for sq, piece in enumerate(np.asarray(board).ravel().tolist()):
+        key ^= ZOBRIST_PIECES[piece + 6][sq]
+    return key
+
+
+def square_attacked(board, sq, by):
+    """
+    Returns True if the square is attacked by any piece of the colour with sign `by` (1 = White, -1 = Black).
+    `board` is a flat list of 64 piece codes.
+    """
+    knight, king, pawn = 3 * by, 6 * by, by
+    for t in KNIGHT_TARGETS[sq]:
+        if board[t] == knight:
+            return True
+    for t in KING_TARGETS[sq]:
+        if board[t] == king:
+            return True
+    # A pawn attacks sq from the squares a pawn of the other colour would capture on.
+    for t in PAWN_ATTACKS[-by][sq]:
+        if board[t] == pawn:
+            return True
+
+    rook, bishop, queen = 2 * by, 4 * by, 5 * by
+    for ray in ROOK_RAYS[sq]:
+        for t in ray:
+            p = board[t]
+            if p:
+                if p == rook or p == queen:
+                    return True
+                break
+    for ray in BISHOP_RAYS[sq]:
+        for t in ray:
+            p = board[t]
+            if p:
+                if p == bishop or p == queen:
+                    return True
+                break
+    return False
+
+
+# Row a pawn has to be on to capture en passant, keyed by pawn code.
+EN_PASSANT_ROWS = {1: 4, -1: 3}
+# For each king code: (index into the castling flags, (king from, king to), squares that must be empty).
+CASTLING = {
+    6: ((0, (3, 1), (1, 2)), (1, (3, 5), (4, 5, 6))),
+    -6: ((2, (59, 57), (57, 58)), (3, (59, 61), (60, 61, 62))),
+}
+
+
+def can_castle(board, from_sq, to_sq):
+    """
+    Returns True if the king on from_sq is not in check and does not pass through an attacked square.
+    Whether the destination square is attacked is left to the usual legality test.
+    """
+    by = -1 if board[from_sq] > 0 else 1
+    return not square_attacked(board, from_sq, by) and not square_attacked(board, (from_sq + to_sq) // 2, by)
+
+
+def pseudo_legal_targets(board, sq, castling, en_passant):
+    """
+    Returns the sorted target squares the piece on sq can move to, ignoring whether its own king is left in check.
+    `castling` is (white short, white long, black short, black long).
+    """
+    piece = board[sq]
+    kind = abs(piece)
+    targets = []
+
+    # Pawn
+    if kind == 1:
+        row, col = divmod(sq, 8)
+        forward = row + piece
+        if 0 <= forward < 8:
+            ahead = forward * 8 + col
+            if board[ahead] == 0:
+                targets.append(ahead)
+                if (piece == 1 and row == 1) or (piece == -1 and row == 6):
+                    double = ahead + piece * 8
+                    if board[double] == 0:
+                        targets.append(double)
+            for c in (col - 1, col + 1):
+                if 0 <= c < 8:
+                    t = forward * 8 + c
+                    if board[t] * piece < 0 or row == EN_PASSANT_ROWS[piece] and \
+                            board[row * 8 + c] == -piece and en_passant[0] == 1 and en_passant[1] == c:
+                        targets.append(t)
+
+    # Knight
+    elif kind == 3:
+        for t in KNIGHT_TARGETS[sq]:
+            if board[t] * piece <= 0:
+                targets.append(t)
+
+    # King
+    elif kind == 6:
+        for t in KING_TARGETS[sq]:
+            if board[t] * piece <= 0:
+                targets.append(t)
+        for flag, (from_sq, to_sq), empty in CASTLING[piece]:
+            if sq == from_sq and castling[flag] and not any(board[s] for s in empty) and \
+                    can_castle(board, from_sq, to_sq):
+                targets.append(to_sq)
+
+    # Rook, Bishop, Queen
+    elif kind in SLIDER_RAYS:
+        for ray in SLIDER_RAYS[kind][sq]:
+            for t in ray:
+                p = board[t]
+                if p == 0:
+                    targets.append(t)
+                else:
+                    if p * piece < 0:
+                        targets.append(t)
+                    break
+
+    targets.sort()
+    return targets
+
+
+# Rook (from square, to square) for each castling king (from square, to square).
+CASTLING_ROOK_MOVES = {(3, 1): (0, 2), (3, 5): (7, 4), (59, 57): (56, 58), (59, 61): (63, 60)}
+
+
+def move_writes(from_sq, to_sq, piece, captured):
+    """
+    Returns, in order, the (square, piece code) writes that playing a move makes on the board.
+    This covers the castling rook, promotion to a queen and the en passant capture.
+    `captured` is the piece code on to_sq before the move.
+    """
+    writes = []
+    # Castling
+    if piece == 6 or piece == -6:
+        rook_move = CASTLING_ROOK_MOVES.get((from_sq, to_sq))
+        if rook_move is not None:
+            writes.append((rook_move[0], 0))
+            writes.append((rook_move[1], 2 if piece > 0 else -2))
+
+    # En Passant Capture: a pawn moving diagonally onto an empty square takes the pawn beside it.
+    if (piece == 1 or piece == -1) and captured == 0 and (to_sq - from_sq) % 8:
+        writes.append((from_sq - from_sq % 8 + to_sq % 8, 0))
+
+    # Promotion
+    if piece == 1 and to_sq >= 56:
+        piece = 5
+    if piece == -1 and to_sq < 8:
+        piece = -5
+
+    writes.append((to_sq, piece))
+    writes.append((from_sq, 0))
+    return writes
+
+
+def slider_attacks(sq, occupied, up_masks, down_masks):
+    """
+    Returns the bitboard of squares a slider on sq attacks along the given rays, stopping at the first blocker.
+    """
+    attacks = 0
+    for masks in up_masks:
+        ray = masks[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= masks[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for masks in down_masks:
+        ray = masks[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= masks[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+def _line_tables():
+    """
+    Returns (between, lines): between[a][b] is the bitboard of squares strictly between two aligned squares and
+    lines[a][b] the whole rank, file or diagonal through them. Both are 0 when a and b are not aligned.
+    """
+    between = [[0] * 64 for _ in range(64)]
+    lines = [[0] * 64 for _ in range(64)]
+    for a in range(64):
+        row, col = divmod(a, 8)
+        for d_row, d_col in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            ray = []
+            r, c = row + d_row, col + d_col
+            while 0 <= r < 8 and 0 <= c < 8:
+                ray.append(r * 8 + c)
+                r, c = r + d_row, c + d_col
+            behind = []
+            r, c = row - d_row, col - d_col
+            while 0 <= r < 8 and 0 <= c < 8:
+                behind.append(r * 8 + c)
+                r, c = r - d_row, c - d_col
+            line = _mask(ray) | _mask(behind) | 1 << a
+            for index, b in enumerate(ray):
+                between[a][b] = _mask(ray[:index])
+                lines[a][b] = line
+    return tuple(map(tuple, between)), tuple(map(tuple, lines))
+
+
+BETWEEN, LINES = _line_tables()
+
+
+def piece_attacks(piece, sq, occupied):
+    """
+    Returns the bitboard of squares the piece on sq attacks, given the occupied squares.
+    """
+    kind = abs(piece)
+    if kind == 0:
+        return 0
+    if kind == 1:
+        return PAWN_MASKS[piece][sq]
+    if kind == 3:
+        return KNIGHT_MASKS[sq]
+    if kind == 6:
+        return KING_MASKS[sq]
+    attacks = 0
+    if kind != 4:
+        attacks = slider_attacks(sq, occupied, ROOK_UP_MASKS, ROOK_DOWN_MASKS)
+    if kind != 2:
+        attacks |= slider_attacks(sq, occupied, BISHOP_UP_MASKS, BISHOP_DOWN_MASKS)
+    return attacks
+
+
+class BitboardPosition:
+    """
+    A compact position made of 64-bit integer bitboards, one per piece code, plus occupancy.
+    Bit n is the square (n // 8, n % 8) of the numpy board used by ChessGame.
+    """
+
+    def __init__(self):
+        # Indexed by piece code + 6, so pieces[0] is the black king and pieces[12] the white king.
+        self.pieces = [0] * 13
+        self.white = 0
+        self.black = 0
+
+    @classmethod
+    def from_array(cls, board):
+        """
+        Builds a position from an 8x8 array of piece codes.
+        """
+        position = cls()
+        pieces = position.pieces
+        for sq, piece in enumerate(np.asarray(board).ravel().tolist()):
+            if piece:
+                pieces[piece + 6] |= 1 << sq
+        position.white = pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11] | pieces[12]
+        position.black = pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5]
+        return position
+
+    def to_array(self):
+        """
+        Returns the position as an 8x8 array of piece codes.
+        """
+        flat = np.zeros(64, dtype=int)
+        for index, bits in enumerate(self.pieces):
+            while bits:
+                low = bits & -bits
+                flat[low.bit_length() - 1] = index - 6
+                bits ^= low
+        return flat.reshape(8, 8)
+
+    @property
+    def occupied(self):
+        return self.white | self.black
+
+    def set_square(self, sq, old, new):
+        """
+        Replaces the piece code old on a square by new (either may be 0).
+        """
+        bit = 1 << sq
+        if old:
+            self.pieces[old + 6] ^= bit
+            if old > 0:
+                self.white ^= bit
+            else:
+                self.black ^= bit
+        if new:
+            self.pieces[new + 6] |= bit
+            if new > 0:
+                self.white |= bit
+            else:
+                self.black |= bit
+
+    def piece_at(self, sq):
+        """
+        Returns the piece code on a square, 0 if it is empty.
+        """
+        bit = 1 << sq
+        if not (self.white | self.black) & bit:
+            return 0
+        for index, bits in enumerate(self.pieces):
+            if bits & bit:
+                return index - 6
+
+    def is_attacked(self, sq, by):
+        """
+        Returns True if the square is attacked by the colour with sign `by` (1 = White, -1 = Black).
+        Gives the same answer as `square_attacked` on the equivalent flat board.
+        """
+        pieces = self.pieces
+        if KNIGHT_MASKS[sq] & pieces[3 * by + 6] or KING_MASKS[sq] & pieces[6 * by + 6] or \
+                PAWN_MASKS[-by][sq] & pieces[by + 6]:
+            return True
+
+        occupied = self.white | self.black
+        rooks = pieces[2 * by + 6] | pieces[5 * by + 6]
+        if rooks and slider_attacks(sq, occupied, ROOK_UP_MASKS, ROOK_DOWN_MASKS) & rooks:
+            return True
+        bishops = pieces[4 * by + 6] | pieces[5 * by + 6]
+        if bishops and slider_attacks(sq, occupied, BISHOP_UP_MASKS, BISHOP_DOWN_MASKS) & bishops:
+            return True
+        return False
+
+    def in_check(self, color):
+        """
+        Returns True if the king of the given colour ('White' or 'Black') is attacked.
+        """
+        sign = 1 if color == 'White' else -1
+        king = self.pieces[6 * sign + 6]
+        return self.is_attacked(king.bit_length() - 1, -sign)
+
+
+class TranspositionTable:
+    """
+    A fixed-size table of results keyed on Zobrist keys. Each key maps to one slot (key % size), which holds the
+    legal moves and/or an evaluation of a single position.
+    replacement decides what happens when a different position already holds the slot:
+    'always' overwrites it, 'depth' only overwrites it if the new result was searched at least as deep.
+    """
+
+    def __init__(self, size=1 << 16, replacement='always'):
+        if replacement not in ('always', 'depth'):
+            raise ValueError("replacement must be 'always' or 'depth', not %r" % (replacement,))
+        self.size = size
+        self.replacement = replacement
+        # Each slot is None or [key, moves, value, depth].
+        self.slots = [None] * size
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(entry is not None for entry in self.slots)
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, key, depth):
+        """
+        Returns the slot entry to write for key, or None if the replacement policy keeps the current occupant.
+        """
+        index = key % self.size
+        entry = self.slots[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        if entry is not None and self.replacement == 'depth' and entry[3] > depth:
+            return None
+        entry = [key, None, None, depth]
+        self.slots[index] = entry
+        return entry
+
+    def get_moves(self, key):
+        """
+        Returns the cached legal moves of the position, or None.
+        """
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key and entry[1] is not None:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def store_moves(self, key, moves):
+        entry = self._entry(key, 0)
+        if entry is not None:
+            entry[1] = moves
+
+    def get_value(self, key, depth=0):
+        """
+        Returns the cached evaluation of the position if it was searched at least depth deep, or None.
+        """
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key and entry[2] is not None and entry[3] >= depth:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        return None
+
+    def store_value(self, key, value, depth=0):
+        entry = self._entry(key, depth)
+        if entry is not None and (entry[2] is None or depth >= entry[3]):
+            entry[2] = value
+            entry[3] = depth
+
+
+# Piece codes of the FEN piece letters.
+FEN_PIECES = {'p': 1, 'r': 2, 'n': 3, 'b': 4, 'q': 5, 'k': 6}
+PIECE_LETTERS = {code: letter for letter, code in FEN_PIECES.items()}
+
+
+def move_to_uci(move):
+    """
+    Returns a move given as (from row, from col, to row, to col) in coordinate notation, e.g. 'e2e4'.
+    """
+    return '%s%d%s%d' % ('hgfedcba'[move[1]], move[0] + 1, 'hgfedcba'[move[3]], move[2] + 1)
+
+
+def uci_to_move(text):
+    """
+    Returns the (from row, from col, to row, to col) move of a coordinate notation move such as 'e2e4'.
+    A trailing promotion letter is ignored, as pawns always promote to a queen.
+    """
+    return int(text[1]) - 1, 'hgfedcba'.index(text[0]), int(text[3]) - 1, 'hgfedcba'.index(text[2])
+
+
+# How a game can end, as returned by ChessGame.outcome().
+CHECKMATE = 'checkmate'
+STALEMATE = 'stalemate'
+THREEFOLD_REPETITION = 'threefold_repetition'
+FIFTY_MOVE_RULE = 'fifty_move_rule'
+INSUFFICIENT_MATERIAL = 'insufficient_material'
+
+DARK_SQUARES = _mask(sq for sq in range(64) if (sq // 8 + sq % 8) % 2 == 0)
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
 class ChessGame:
     """
     An environment for Chess.
     """
 
-    def __init__(self):
+    def __init__(self, transposition_table=None):
         '''
         Initializes following params:
         board: 8x8 board with piece positions
         white_to move: boolean to tell which player it is to move
         white_can_castle: boolean to tell can white castle?
         black_can_castle: boolean to tell can black castle?
+        undo_stack: what each move played with push() changed, so pop() can take it back
+        zobrist: 64-bit key of the position, kept up to date by push() and pop()
+        bitboards: BitboardPosition of the board, kept up to date by push() and pop()
+        piece_attacks: bitboard of the squares attacked by the piece on each square, kept up to date by push() and pop()
+        transposition_table: optional TranspositionTable used to cache legal move lists
+        halfmove_clock: plies since the last capture or pawn move, for the fifty-move rule
+        position_counts: how many times each Zobrist key has occurred in the game, for repetitions
+        termination: how the game ended (see outcome()) once update() has found it over, otherwise None
         '''
         self.board = np.zeros((8, 8), dtype=int)
 
@@ -54,27 +603,151 @@ class ChessGame:
         self.black_can_short_castle = True
         self.black_can_long_castle = True
         self.winner = None
+        self.termination = None
         self.en_passant = [0, 0]
+        self.halfmove_clock = 0
+        self.undo_stack = []
+        self.transposition_table = transposition_table
+        self.refresh()
+
+    def refresh(self):
+        '''
+        Rebuilds the Zobrist key, bitboards and attack maps from the board and game parameters.
+        Call this after editing the board or parameters directly instead of through push().
+        '''
+        self.zobrist = zobrist_hash(self.board, self.to_move, self.castling_rights(), self.en_passant)
+        self.bitboards = BitboardPosition.from_array(self.board)
+        occupied = self.bitboards.occupied
+        self.piece_attacks = [piece_attacks(piece, sq, occupied) for sq, piece in enumerate(self.board.ravel().tolist())]
+        # Per position caches: attack map of each colour (White, Black) and the check information of the side to
+        # move. They are saved on the undo stack so pop() restores them.
+        self._attack_maps = [None, None]
+        self._check_info = None
+        # Only the current position is known; moves played before the refresh are not counted as repetitions.
+        self.position_counts = {self.zobrist: 1}
+
+    @classmethod
+    def from_fen(cls, fen, transposition_table=None):
+        '''
+        Sets up a game from a FEN string. Rank 1 is row 0 and the a-file is column 7, so the start position
+        matches the board built in __init__. The fullmove number is ignored.
+        '''
+        fields = fen.split()
+        game = cls(transposition_table)
+        game.board[:, :] = 0
+        for rank, row_text in enumerate(fields[0].split('/')):
+            col = 7
+            for char in row_text:
+                if char.isdigit():
+                    col -= int(char)
+                else:
+                    piece = FEN_PIECES[char.lower()]
+                    game.board[7 - rank][col] = piece if char.isupper() else -piece
+                    col -= 1
+
+        game.to_move = 'White' if len(fields) < 2 or fields[1] == 'w' else 'Black'
+        castling = fields[2] if len(fields) > 2 else '-'
+        game.white_can_short_castle = 'K' in castling
+        game.white_can_long_castle = 'Q' in castling
+        game.black_can_short_castle = 'k' in castling
+        game.black_can_long_castle = 'q' in castling
+        if len(fields) > 3 and fields[3] != '-':
+            game.en_passant = [1, 7 - (ord(fields[3][0]) - ord('a'))]
+        if len(fields) > 4:
+            game.halfmove_clock = int(fields[4])
+        game.refresh()
+        return game
+
+    def __str__(self):
+        '''
+        Draws the board as text, White at the bottom, using FEN letters and '.' for empty squares.
+        '''
+        lines = []
+        for row in range(7, -1, -1):
+            squares = []
+            for col in range(7, -1, -1):
+                piece = int(self.board[row][col])
+                letter = PIECE_LETTERS.get(abs(piece), '.')
+                squares.append(letter.upper() if piece > 0 else letter)
+            lines.append('%d %s' % (row + 1, ' '.join(squares)))
+        lines.append('  a b c d e f g h')
+        return '\n'.join(lines)
 
     def in_check(self, color):
         '''
         This is a function to check for check.
         It takes in a board and a color, and it returns True or False.
         '''
-        # Get king position.
-        if color == 'White':
-            king_pos = np.where(self.board == 6)
-            enemy_piece = np.where(self.board < 0)
-        elif color == 'Black':
-            king_pos = np.where(self.board == -6)
-            enemy_piece = np.where(self.board > 0)
-        king_pos = (king_pos[0][0], king_pos[1][0])
-
-        # Check if any opposite color piece can move to the king position.
-        for i, j in zip(enemy_piece[0], enemy_piece[1]):
-            if self.can_move(self.board[i][j], (i, j), king_pos):
-                return True
-        return False
+        sign = 1 if color == 'White' else -1
+        return bool(self.bitboards.pieces[6 * sign + 6] & self.attack_map(-sign))
+
+    def attack_map(self, sign):
+        '''
+        returns the bitboard of squares attacked by the colour with sign `sign` (1 = White, -1 = Black).
+        '''
+        index = 0 if sign > 0 else 1
+        attacks = self._attack_maps[index]
+        if attacks is None:
+            attacks = 0
+            pieces = self.bitboards.white if sign > 0 else self.bitboards.black
+            piece_attacks = self.piece_attacks
+            while pieces:
+                low = pieces & -pieces
+                attacks |= piece_attacks[low.bit_length() - 1]
+                pieces ^= low
+            self._attack_maps[index] = attacks
+        return attacks
+
+    def check_info(self):
+        '''
+        returns (checkers, pinned, pin_lines, danger) for the colour to play:
+        checkers: bitboard of enemy pieces giving check
+        pinned: bitboard of own pieces pinned to the king
+        pin_lines: for each pinned square, the bitboard of the line it may move along
+        danger: squares the king may not move to, i.e. enemy attacks with the king itself taken off the board
+        '''
+        if self._check_info is not None:
+            return self._check_info
+        sign = 1 if self.to_move == 'White' else -1
+        pieces = self.bitboards.pieces
+        king = pieces[6 * sign + 6]
+        king_sq = king.bit_length() - 1
+        occupied = self.bitboards.white | self.bitboards.black
+        own = self.bitboards.white if sign > 0 else self.bitboards.black
+        danger = self.attack_map(-sign)
+
+        checkers = 0
+        if danger & king:
+            enemy = self.bitboards.black if sign > 0 else self.bitboards.white
+            while enemy:
+                low = enemy & -enemy
+                sq = low.bit_length() - 1
+                if self.piece_attacks[sq] & king:
+                    checkers |= low
+                    code = int(self.board.reshape(-1)[sq])
+                    if abs(code) in SLIDER_RAYS:
+                        # The king cannot step back along the checking line.
+                        danger |= piece_attacks(code, sq, occupied ^ king)
+                enemy ^= low
+
+        pinned = 0
+        pin_lines = {}
+        rooks = pieces[6 - 2 * sign] | pieces[6 - 5 * sign]
+        bishops = pieces[6 - 4 * sign] | pieces[6 - 5 * sign]
+        for sliders, rays in ((rooks, ROOK_UP_MASKS + ROOK_DOWN_MASKS), (bishops, BISHOP_UP_MASKS + BISHOP_DOWN_MASKS)):
+            for masks in rays:
+                candidates = sliders & masks[king_sq]
+                while candidates:
+                    low = candidates & -candidates
+                    sq = low.bit_length() - 1
+                    blockers = BETWEEN[king_sq][sq] & occupied
+                    if blockers and not blockers & (blockers - 1) and blockers & own:
+                        pinned |= blockers
+                        pin_lines[blockers.bit_length() - 1] = LINES[king_sq][sq]
+                    candidates ^= low
+
+        self._check_info = (checkers, pinned, pin_lines, danger)
+        return self._check_info
 
     def can_move(self, piece, move_from, move_to):
         """
@@ -104,7 +777,7 @@ class ChessGame:
                         return True
                 # Check if it can capture diagonally (inc. en passant)
                 if end_row == start_row + 1 and abs(end_col - start_col) == 1:
-                    if self.board[end_row][end_col] < 0 or\
+                    if self.board[end_row][end_col] < 0 or start_row == 4 and \
                             self.board[start_row][end_col] == -1 and self.en_passant[0] == 1 and self.en_passant[1] == end_col:
                         return True
             else:  # Black pawn
@@ -120,7 +793,7 @@ class ChessGame:
                         return True
                 # Check if it can capture diagonally
                 if end_row == start_row - 1 and abs(end_col - start_col) == 1:
-                    if self.board[end_row][end_col] > 0 or\
+                    if self.board[end_row][end_col] > 0 or start_row == 3 and \
                             self.board[start_row][end_col] == 1 and self.en_passant[0] == 1 and self.en_passant[1] == end_col:
                         return True
 
@@ -193,21 +866,21 @@ class ChessGame:
 
         # King
         elif abs(piece) == 6:
-            # Castling
-            if piece == 6:
+            # Castling (not out of or through check)
+            if piece == 6 and move_from == (0, 3):
                 if move_to == (0, 1) and self.board[0, 2] == 0 and self.board[
                     0, 1] == 0 and self.white_can_short_castle:
-                    return True
+                    return can_castle(self.board.ravel().tolist(), 3, 1)
                 if move_to == (0, 5) and self.board[0, 4] == 0 and self.board[0, 5] == 0 and self.board[
                     0, 6] == 0 and self.white_can_long_castle:
-                    return True
-            if piece == -6:
+                    return can_castle(self.board.ravel().tolist(), 3, 5)
+            if piece == -6 and move_from == (7, 3):
                 if move_to == (7, 1) and self.board[7, 2] == 0 and self.board[
                     7, 1] == 0 and self.black_can_short_castle:
-                    return True
+                    return can_castle(self.board.ravel().tolist(), 59, 57)
                 if move_to == (7, 5) and self.board[7, 4] == 0 and self.board[7, 5] == 0 and self.board[
                     7, 6] == 0 and self.black_can_long_castle:
-                    return True
+                    return can_castle(self.board.ravel().tolist(), 59, 61)
 
             # Normal move
             if abs(start_row - end_row) <= 1 and abs(start_col - end_col) <= 1:
@@ -224,131 +897,296 @@ class ChessGame:
         """
         returns True if a move from a square to a square by a piece is legal.
         """
-        temp = self.board[move_to[0]][move_to[1]]
-        self.board[move_to[0]][move_to[1]] = piece
-        self.board[move_from[0]][move_from[1]] = 0
-        if self.in_check(self.to_move):
-            self.board[move_to[0]][move_to[1]] = temp
-            self.board[move_from[0]][move_from[1]] = piece
-            return False
-        else:
-            self.board[move_to[0]][move_to[1]] = temp
-            self.board[move_from[0]][move_from[1]] = piece
-            return True
+        color = self.to_move
+        self.push((move_from[0], move_from[1], move_to[0], move_to[1]))
+        legal = not self.in_check(color)
+        self.pop()
+        return legal
+
+    def castling_rights(self):
+        '''
+        returns the castling flags as (white short, white long, black short, black long).
+        '''
+        return (self.white_can_short_castle, self.white_can_long_castle,
+                self.black_can_short_castle, self.black_can_long_castle)
+
+    def _legal_moves(self):
+        '''
+        Yields every legal move (from square, to square) for the colour to play, ordered by from then to square.
+        Uses the cached check information instead of trying each move: the king avoids the danger squares, a pinned
+        piece stays on its pin line, and in check a move must take the checker or block it.
+        '''
+        sign = 1 if self.to_move == 'White' else -1
+        board = self.board.ravel().tolist()
+        castling = self.castling_rights()
+        checkers, pinned, pin_lines, danger = self.check_info()
+        king_sq = self.bitboards.pieces[6 * sign + 6].bit_length() - 1
+        double_check = checkers & (checkers - 1)
+        if checkers:
+            evasions = checkers | BETWEEN[king_sq][checkers.bit_length() - 1]
+
+        own = self.bitboards.white if sign > 0 else self.bitboards.black
+        while own:
+            low = own & -own
+            sq = low.bit_length() - 1
+            own ^= low
+            if sq == king_sq:
+                for t in pseudo_legal_targets(board, sq, castling, self.en_passant):
+                    if not danger >> t & 1:
+                        yield sq, t
+                continue
+            if double_check:
+                continue
+            piece = board[sq]
+            line = pin_lines[sq] if pinned & low else -1
+            for t in pseudo_legal_targets(board, sq, castling, self.en_passant):
+                if (piece == 1 or piece == -1) and board[t] == 0 and (t - sq) % 8:
+                    # En passant takes a pawn off a square other than t, so play it out to be sure.
+                    writes = move_writes(sq, t, piece, 0)
+                    undo = [(s, board[s]) for s, _ in writes]
+                    for s, p in writes:
+                        board[s] = p
+                    attacked = square_attacked(board, king_sq, -sign)
+                    for s, p in reversed(undo):
+                        board[s] = p
+                    if not attacked:
+                        yield sq, t
+                    continue
+                if not line >> t & 1:
+                    continue
+                if checkers and not evasions >> t & 1:
+                    continue
+                yield sq, t
 
     def no_legal_moves(self):
         '''
         returns true if there exists no legal moves for the colour to play.
         '''
-        if self.to_move == 'White':
-            pieces = np.where(self.board > 0)
-        elif self.to_move == 'Black':
-            pieces = np.where(self.board < 0)
-
-        for i, j in zip(pieces[0], pieces[1]):
-            for x in range(0, 8):
-                for y in range(0, 8):
-                    if self.can_move(self.board[i][j], (i, j), (x, y)) and self.legal_move(self.board[i][j], (i, j),
-                                                                                           (x, y)):
-                        return False
-        return True
+        if self.transposition_table is not None:
+            moves = self.transposition_table.get_moves(self.zobrist)
+            if moves is not None:
+                return not moves
+        return next(self._legal_moves(), None) is None
 
     def return_legal_moves(self):
-        legal_moves = []
+        '''
+        returns every legal move for the colour to play as (from row, from col, to row, to col).
+        '''
+        table = self.transposition_table
+        if table is not None:
+            moves = table.get_moves(self.zobrist)
+            if moves is not None:
+                return list(moves)
+        moves = [(f // 8, f % 8, t // 8, t % 8) for f, t in self._legal_moves()]
+        if table is not None:
+            table.store_moves(self.zobrist, tuple(moves))
+        return moves
+
+    def push(self, move):
+        """
+        Plays a move given as (from row, from col, to row, to col) without checking that it is possible or legal.
+        Records what the move changed on the undo stack so pop() can take it back.
+        """
+        from_sq = move[0] * 8 + move[1]
+        to_sq = move[2] * 8 + move[3]
+        flat = self.board.reshape(-1)
+        piece = int(flat[from_sq])
+        writes = move_writes(from_sq, to_sq, piece, int(flat[to_sq]))
+        castling, en_passant, to_move = self.castling_rights(), tuple(self.en_passant), self.to_move
+        undo_writes = [(sq, int(flat[sq])) for sq, _ in writes]
+        halfmove_clock = self.halfmove_clock
+
+        # Play The Move
+        key = self.zobrist ^ zobrist_state(to_move, castling, en_passant)
+        bitboards = self.bitboards
+        for sq, value in writes:
+            old = int(flat[sq])
+            key ^= ZOBRIST_PIECES[old + 6][sq] ^ ZOBRIST_PIECES[value + 6][sq]
+            bitboards.set_square(sq, old, value)
+            flat[sq] = value
+        self.undo_stack.append((undo_writes, castling, en_passant, to_move, self.zobrist,
+                                self._update_attacks(writes, flat), self._attack_maps, self._check_info,
+                                halfmove_clock))
+        self._attack_maps = [None, None]
+        self._check_info = None
+        piece = writes[-2][1]
+        move_from, move_to = (move[0], move[1]), (move[2], move[3])
+
+        # Fifty-Move Counter: reset by a pawn move (the old piece on the from square) or a capture (on the to square)
+        mover, captured = undo_writes[-1][1], undo_writes[-2][1]
+        if mover == 1 or mover == -1 or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock = halfmove_clock + 1
+
+        # En Passant Logic
+        en_passant = list(self.en_passant)
+        if abs(piece) == 1 and abs(move_from[0] - move_to[0]) == 2:
+            en_passant[0] = min(en_passant[0] + 2, 2)
+            en_passant[1] = move_from[1]
+
+        # Decrement En Passant Counter
+        en_passant[0] = max(en_passant[0] - 1, 0)
+        self.en_passant = en_passant
+
+        # Castling Rights
+        if piece == 6:
+            self.white_can_short_castle = False
+            self.white_can_long_castle = False
+        if piece == -6:
+            self.black_can_short_castle = False
+            self.black_can_long_castle = False
+        if piece == 2 and move_from == (0, 0) or move_to == (0, 0):
+            self.white_can_short_castle = False
+        if piece == 2 and move_from == (0, 7) or move_to == (0, 7):
+            self.white_can_long_castle = False
+        if piece == -2 and move_from == (7, 0) or move_to == (7, 0):
+            self.black_can_short_castle = False
+        if piece == -2 and move_from == (7, 7) or move_to == (7, 7):
+            self.black_can_long_castle = False
+
+        # Switch the turn to the other player
         if self.to_move == 'White':
-            pieces = np.where(self.board > 0)
+            self.to_move = 'Black'
         elif self.to_move == 'Black':
-            pieces = np.where(self.board < 0)
+            self.to_move = 'White'
+        self.zobrist = key ^ zobrist_state(self.to_move, self.castling_rights(), self.en_passant)
+        counts = self.position_counts
+        counts[self.zobrist] = counts.get(self.zobrist, 0) + 1
 
-        for i, j in zip(pieces[0], pieces[1]):
-            for x in range(0, 8):
-                for y in range(0, 8):
-                    if self.can_move(self.board[i][j], (i, j), (x, y)) and self.legal_move(self.board[i][j], (i, j),
-                                                                                           (x, y)):
-                        legal_moves.append((i, j, x, y))
-        return legal_moves
+    def played_move(self, back=1):
+        """
+        Returns the move played back plies ago with push(), as (from row, from col, to row, to col).
+        The undo record keeps the squares in move_writes() order, which ends with the to and then the from square.
+        """
+        writes = self.undo_stack[-back][0]
+        from_sq, to_sq = writes[-1][0], writes[-2][0]
+        return from_sq // 8, from_sq % 8, to_sq // 8, to_sq % 8
+
+    def _update_attacks(self, writes, flat):
+        '''
+        Updates piece_attacks after the board writes of a move and returns the (square, old attacks) it replaced.
+        Only the written squares and the sliders whose attacks reach a written square can have changed.
+        '''
+        attacks = self.piece_attacks
+        bitboards = self.bitboards
+        occupied = bitboards.white | bitboards.black
+        changed = 0
+        for sq, _ in writes:
+            changed |= 1 << sq
+        undo = []
+        squares = changed
+        while squares:
+            low = squares & -squares
+            sq = low.bit_length() - 1
+            undo.append((sq, attacks[sq]))
+            attacks[sq] = piece_attacks(int(flat[sq]), sq, occupied)
+            squares ^= low
+        pieces = bitboards.pieces
+        sliders = (pieces[4] | pieces[2] | pieces[1] | pieces[8] | pieces[10] | pieces[11]) & ~changed
+        while sliders:
+            low = sliders & -sliders
+            sq = low.bit_length() - 1
+            if attacks[sq] & changed:
+                undo.append((sq, attacks[sq]))
+                attacks[sq] = piece_attacks(int(flat[sq]), sq, occupied)
+            sliders ^= low
+        return undo
+
+    def pop(self):
+        """
+        Takes back the last move played with push().
+        """
+        counts = self.position_counts
+        if counts[self.zobrist] == 1:
+            del counts[self.zobrist]
+        else:
+            counts[self.zobrist] -= 1
+        (writes, castling, en_passant, to_move, self.zobrist, attacks,
+         self._attack_maps, self._check_info, self.halfmove_clock) = self.undo_stack.pop()
+        self.termination = None
+        self.winner = None
+        flat = self.board.reshape(-1)
+        bitboards = self.bitboards
+        for sq, value in reversed(writes):
+            bitboards.set_square(sq, int(flat[sq]), value)
+            flat[sq] = value
+        piece_attacks = self.piece_attacks
+        for sq, value in reversed(attacks):
+            piece_attacks[sq] = value
+        (self.white_can_short_castle, self.white_can_long_castle,
+         self.black_can_short_castle, self.black_can_long_castle) = castling
+        self.en_passant = list(en_passant)
+        self.to_move = to_move
+
+    def perft(self, depth):
+        """
+        Returns the number of leaf positions reached by playing every legal move sequence of the given depth.
+        """
+        if depth <= 0:
+            return 1
+        moves = self.return_legal_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.push(move)
+            nodes += self.perft(depth - 1)
+            self.pop()
+        return nodes
+
+    def insufficient_material(self):
+        '''
+        returns true if neither side has the material to checkmate: kings with at most one knight or bishop between
+        them, or only bishops all on squares of one colour.
+        '''
+        pieces = self.bitboards.pieces
+        # Pawns, rooks and queens of either colour.
+        if pieces[7] | pieces[5] | pieces[8] | pieces[4] | pieces[11] | pieces[1]:
+            return False
+        knights = pieces[9] | pieces[3]
+        bishops = pieces[10] | pieces[2]
+        if _popcount(knights | bishops) <= 1:
+            return True
+        return not knights and (not bishops & DARK_SQUARES or not bishops & ~DARK_SQUARES)
+
+    def outcome(self):
+        '''
+        returns how the game has ended in the current position, or None if it goes on:
+        CHECKMATE or STALEMATE if the side to move has no legal moves, otherwise THREEFOLD_REPETITION if the position
+        has occurred three times, FIFTY_MOVE_RULE after fifty moves by each side without a capture or pawn move, or
+        INSUFFICIENT_MATERIAL if no checkmate is possible. The draws are applied automatically rather than claimed.
+        '''
+        if self.no_legal_moves():
+            return CHECKMATE if self.in_check(self.to_move) else STALEMATE
+        return self.draw_reason()
+
+    def draw_reason(self):
+        '''
+        returns the draw rule that ends the game in the current position, or None, without generating any moves.
+        '''
+        if self.position_counts.get(self.zobrist, 0) >= 3:
+            return THREEFOLD_REPETITION
+        if self.halfmove_clock >= 100:
+            return FIFTY_MOVE_RULE
+        if self.insufficient_material():
+            return INSUFFICIENT_MATERIAL
+        return None
 
     def update(self, piece, move_from, move_to):
+        '''
+        Plays a move if it is possible and legal and the game is not over. Returns the termination once the game is
+        over (see outcome()), with the winner in self.winner after a checkmate, or None while the game goes on.
+        '''
+        if self.termination is not None:
+            return self.termination
         # If the move is possible and legal.
         if self.can_move(piece, move_from, move_to):
             if self.legal_move(piece, move_from, move_to):
-                # Check if castling.
-                if piece == 6 and move_to == (0, 5):
-                    self.board[0, 7] = 0
-                    self.board[0, 4] = 2
-
-                if piece == 6 and move_to == (0, 1):
-                    self.board[0, 0] = 0
-                    self.board[0, 2] = 2
-
-                if piece == -6 and move_to == (7, 5):
-                    self.board[7, 7] = 0
-                    self.board[7, 4] = -2
-
-                if piece == -6 and move_to == (7, 1):
-                    self.board[7, 0] = 0
-                    self.board[7, 2] = -2
-
-                # Promotion
-                if piece == 1 and move_to[0] == 7:
-                    piece = 5
-                if piece == -1 and move_to[0] == 0:
-                    piece = -5
-
-                # En Passant Logic
-                if abs(piece) == 1 and abs(move_from[0]-move_to[0]) == 2:
-                    self.en_passant[0] = min(self.en_passant[0] + 2, 2)
-                    self.en_passant[1] = move_from[1]
-
-                # En Passant Capture
-                if piece == 1 and move_to[0] == 5:
-                    self.board[move_from[0]][move_to[1]] = 0
-                if piece == -1 and move_to[0] == 2:
-                    self.board[move_from[0]][move_to[1]] = 0
-
-                # Play The Move
-                self.board[move_to[0]][move_to[1]] = piece
-                self.board[move_from[0]][move_from[1]] = 0
-
-                # Decrement En Passant Counter
-                self.en_passant[0] = max(self.en_passant[0] - 1, 0)
-
-                # Castling Rights
-                if piece == 6:
-                    self.white_can_short_castle = False
-                    self.white_can_long_castle = False
-                    # print("White lost both short and long castle")
-                if piece == -6:
-                    self.black_can_short_castle = False
-                    self.black_can_long_castle = False
-                    # print("Black lost both short and long castle")
-                if piece == 2 and move_from[1] == 0 or move_to == (0, 0):
-                    self.white_can_short_castle = False
-                    # print("White lost short castle")
-                if piece == 2 and move_from[1] == 7 or move_to == (0, 7):
-                    self.white_can_long_castle = False
-                    # print("White lost long castle")
-                if piece == -2 and move_from[1] == 0 or move_to == (7, 0):
-                    self.black_can_short_castle = False
-                    # print("Black lost short castle")
-                if piece == -2 and move_from[1] == 7 or move_to == (7, 7):
-                    self.black_can_long_castle = False
-                    # print("Black lost long castle")
-
-                # Check for end conditions otherwise switch the turn to the other player
-                if self.to_move == 'White':
-                    self.to_move = 'Black'
-                elif self.to_move == 'Black':
-                    self.to_move = 'White'
-
-                if self.no_legal_moves():
-                    if self.in_check(self.to_move):
-                        if self.to_move == 'White':
-                            winner = 'Black'
-                        elif self.to_move == 'Black':
-                            winner = 'White'
-                        print(winner + " wins.")
-                        self.winner = winner
-                        exit(0)
-                    else:
-                        print("Stalemate.")
+                self.push((move_from[0], move_from[1], move_to[0], move_to[1]))
+
+                # Check for end conditions
+                self.termination = self.outcome()
+                if self.termination == CHECKMATE:
+                    self.winner = 'Black' if self.to_move == 'White' else 'White'
+        return self.termination
@@ -0,0 +1,136 @@
+import numpy as np
+
+# Input planes, each an 8x8 board in the same row/column layout as ChessGame.board:
+#   0-5    White pawn, rook, knight, bishop, queen, king (piece codes 1 to 6)
+#   6-11   Black pawn, rook, knight, bishop, queen, king (piece codes -1 to -6)
+#   12     side to move, all ones when White is to move
+#   13-16  castling rights: White short, White long, Black short, Black long
+#   17     en passant, a one on the square a pawn can capture onto this move
+#   18-19  repetitions, all ones if the position has occurred before at least once / twice
+#   20     move count, the number of plies played (capped at 255 so it fits uint8 buffers)
+NUM_PLANES = 21
+PIECE_CODES = np.array([1, 2, 3, 4, 5, 6, -1, -2, -3, -4, -5, -6]).reshape(12, 1, 1)
+SIDE_PLANE = 12
+CASTLING_PLANES = slice(13, 17)
+EN_PASSANT_PLANE = 17
+REPETITION_PLANES = slice(18, 20)
+MOVE_COUNT_PLANE = 20
+MAX_MOVE_COUNT = 255
+
+# Row of the square a pawn captures onto en passant, by the side to move.
+EN_PASSANT_TARGET_ROWS = {'White': 5, 'Black': 2}
+
+
+def planes_buffer(n, dtype=np.float32):
+    """
+    Returns a zeroed (n, NUM_PLANES, 8, 8) buffer to encode positions into. Allocate it once and reuse it.
+    """
+    return np.zeros((n, NUM_PLANES, 8, 8), dtype=dtype)
+
+
+def repetitions(game):
+    """
+    Returns how many times the current position of game occurred earlier in the game.
+    """
+    return game.position_counts.get(game.zobrist, 1) - 1
+
+
+def encode_game(game, out):
+    """
+    Writes the planes of one ChessGame into out, a (NUM_PLANES, 8, 8) array such as one row of planes_buffer.
+    Nothing is allocated per call, so out can be float32, uint8 or any other numeric type.
+    """
+    np.equal(game.board, PIECE_CODES, out=out[:12], casting='unsafe')
+    out[SIDE_PLANE] = game.to_move == 'White'
+    for plane, right in zip(range(CASTLING_PLANES.start, CASTLING_PLANES.stop), game.castling_rights()):
+        out[plane] = right
+    out[EN_PASSANT_PLANE] = 0
+    if game.en_passant[0] == 1:
+        out[EN_PASSANT_PLANE, EN_PASSANT_TARGET_ROWS[game.to_move], game.en_passant[1]] = 1
+    count = repetitions(game)
+    out[REPETITION_PLANES.start] = count >= 1
+    out[REPETITION_PLANES.start + 1] = count >= 2
+    out[MOVE_COUNT_PLANE] = min(len(game.undo_stack), MAX_MOVE_COUNT)
+    return out
+
+
+def encode_games(games, out):
+    """
+    Writes the planes of a list of games into the first len(games) rows of out, a buffer from planes_buffer,
+    and returns that part of out.
+    """
+    for k, game in enumerate(games):
+        encode_game(game, out[k])
+    return out[:len(games)]
+
+
+def encode_boards(boards, white_to_move, castling, en_passant, out, plies=None, repeats=None):
+    """
+    Writes the planes of a batch of positions held in arrays, as kept by VectorChessEnv, into out and returns it.
+    boards: (N, 8, 8) piece codes
+    white_to_move: (N,) booleans
+    castling: (N, 4) booleans, in the order of ChessGame.castling_rights()
+    en_passant: (N, 2) ChessGame.en_passant of each position
+    plies: optional (N,) plies played, repeats: optional (N,) earlier occurrences of each position
+    """
+    n = len(boards)
+    out = out[:n]
+    np.equal(boards[:, None], PIECE_CODES, out=out[:, :12], casting='unsafe')
+    out[:, SIDE_PLANE] = white_to_move[:, None, None]
+    out[:, CASTLING_PLANES] = castling[:, :, None, None]
+    out[:, EN_PASSANT_PLANE] = 0
+    index = np.flatnonzero(en_passant[:, 0] == 1)
+    if len(index):
+        rows = np.where(white_to_move[index], EN_PASSANT_TARGET_ROWS['White'], EN_PASSANT_TARGET_ROWS['Black'])
+        out[index, EN_PASSANT_PLANE, rows, en_passant[index, 1]] = 1
+    if repeats is None:
+        out[:, REPETITION_PLANES] = 0
+    else:
+        out[:, REPETITION_PLANES.start] = (repeats >= 1)[:, None, None]
+        out[:, REPETITION_PLANES.start + 1] = (repeats >= 2)[:, None, None]
+    if plies is None:
+        out[:, MOVE_COUNT_PLANE] = 0
+    else:
+        out[:, MOVE_COUNT_PLANE] = np.minimum(plies, MAX_MOVE_COUNT)[:, None, None]
+    return out
+
+
+def encode_env(env, out):
+    """
+    Writes the planes of every game of a VectorChessEnv into out and returns it.
+    """
+    repeats = np.array([repetitions(game) for game in env.games])
+    return encode_boards(env.boards, env.white_to_move, env.castling, env.en_passant, out, env.plies, repeats)
+
+
+def encode_moves(moves):
+    """
+    Returns the action indices of a list of (from row, from col, to row, to col) moves as an int64 array.
+    The mapping is the one of vector_env.encode_move: from square * 64 + to square, with squares row * 8 + col.
+    """
+    if not moves:
+        return np.zeros(0, dtype=np.int64)
+    moves = np.asarray(moves, dtype=np.int64)
+    return (moves[:, 0] * 8 + moves[:, 1]) * 64 + moves[:, 2] * 8 + moves[:, 3]
+
+
+def legal_move_mask(move_lists, out):
+    """
+    Marks the legal actions of a batch in out, an (N, ACTION_SIZE) boolean buffer, and returns the first
+    len(move_lists) rows. move_lists holds the legal moves of each position, e.g. game.return_legal_moves().
+    """
+    n = len(move_lists)
+    out = out[:n]
+    out[:] = False
+    counts = [len(moves) for moves in move_lists]
+    actions = encode_moves([move for moves in move_lists for move in moves])
+    out[np.repeat(np.arange(n), counts), actions] = True
+    return out
+
+
+def games_legal_move_mask(games, out):
+    """
+    Marks the legal actions of a list of games in out, an (N, ACTION_SIZE) boolean buffer.
+    """
+    return legal_move_mask([game.return_legal_moves() for game in games], out)
+
@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+
+from chess import ChessGame
+from vector_env import decode_action, encode_move
+
+# An archive is two files next to each other:
+#   <path>.moves  the header, then every move of every game as a little-endian uint16 action index
+#                 (from square * 64 + to square), games one after another
+#   <path>.index  the header, then one INDEX_DTYPE record per game
+# Both files only ever grow, so a writer can stream games into them while readers map what is already there.
+MAGIC = b'CRLGAME1'
+HEADER_SIZE = len(MAGIC)
+MOVE_DTYPE = np.dtype('<u2')
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('length', '<u4'), ('winner', 'i1'), ('termination', 'u1')])
+
+# How a game ended. Stored in the index by position in this tuple, so new values only ever go at the end.
+TERMINATIONS = ('unfinished', 'checkmate', 'stalemate', 'max_plies', 'threefold_repetition', 'fifty_move_rule',
+                'insufficient_material')
+WINNERS = {'White': 1, 'Black': -1, None: 0}
+
+
+def _open(path, size_unit):
+    """
+    Opens one archive file for appending, writing the header if it is new, and returns it with the number of
+    records already in it.
+    """
+    exists = os.path.exists(path) and os.path.getsize(path) > 0
+    handle = open(path, 'r+b' if exists else 'w+b')
+    if exists:
+        if handle.read(HEADER_SIZE) != MAGIC:
+            handle.close()
+            raise ValueError("%s is not a game archive" % path)
+        size = handle.seek(0, os.SEEK_END) - HEADER_SIZE
+        # Drop a partly written record left by an interrupted writer.
+        handle.truncate(HEADER_SIZE + size - size % size_unit)
+    else:
+        handle.write(MAGIC)
+    handle.seek(0, os.SEEK_END)
+    return handle, (handle.tell() - HEADER_SIZE) // size_unit
+
+
+class GameWriter:
+    """
+    Appends games to an archive, flushing after each one so readers see it straight away.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.moves_file, _ = _open(path + '.moves', MOVE_DTYPE.itemsize)
+        self.index_file, self.num_games = _open(path + '.index', INDEX_DTYPE.itemsize)
+        if self.num_games:
+            # Continue after the last indexed game, dropping moves of a game whose index record was never written.
+            self.index_file.seek(HEADER_SIZE + (self.num_games - 1) * INDEX_DTYPE.itemsize)
+            last = np.frombuffer(self.index_file.read(INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)[0]
+            self.num_moves = int(last['offset']) + int(last['length'])
+        else:
+            self.num_moves = 0
+        self.moves_file.truncate(HEADER_SIZE + self.num_moves * MOVE_DTYPE.itemsize)
+        self.moves_file.seek(0, os.SEEK_END)
+        self.index_file.seek(0, os.SEEK_END)
+
+    def write_game(self, moves, winner=None, termination='unfinished'):
+        """
+        Appends one game given as a list of (from row, from col, to row, to col) moves.
+        winner is 'White', 'Black' or None, and termination one of TERMINATIONS.
+        """
+        self.moves_file.write(np.array([encode_move(move) for move in moves], dtype=MOVE_DTYPE).tobytes())
+        self.moves_file.flush()
+        entry = np.array([(self.num_moves, len(moves), WINNERS[winner], TERMINATIONS.index(termination))],
+                         dtype=INDEX_DTYPE)
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+        self.num_moves += len(moves)
+        self.num_games += 1
+
+    def write_record(self, record):
+        """
+        Appends a game record as produced by selfplay.play_game.
+        """
+        self.write_game(record['moves'], record['winner'], record['result'])
+
+    def close(self):
+        self.moves_file.close()
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameArchive:
+    """
+    Reads an archive through memory maps, so only the games actually looked at are paged in.
+    Positions are produced by replaying moves, as (8, 8) board arrays.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for suffix in ('.moves', '.index'):
+            with open(path + suffix, 'rb') as handle:
+                if handle.read(HEADER_SIZE) != MAGIC:
+                    raise ValueError("%s%s is not a game archive" % (path, suffix))
+        self.index = self._map(path + '.index', INDEX_DTYPE)
+        self.moves = self._map(path + '.moves', MOVE_DTYPE)
+        # Number of positions before each game, to find the game holding the n-th position of the archive.
+        self.position_offsets = np.concatenate(([0], np.cumsum(self.index['length'], dtype=np.int64)))
+
+    @staticmethod
+    def _map(path, dtype):
+        count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def num_positions(self):
+        return int(self.position_offsets[-1])
+
+    def game_moves(self, game):
+        """
+        Returns the moves of a game as (from row, from col, to row, to col) tuples.
+        """
+        entry = self.index[game]
+        start = int(entry['offset'])
+        return [decode_action(action) for action in self.moves[start:start + int(entry['length'])]]
+
+    def game_result(self, game):
+        """
+        Returns (winner, termination) of a game, with winner 'White', 'Black' or None.
+        """
+        entry = self.index[game]
+        winner = {1: 'White', -1: 'Black'}.get(int(entry['winner']))
+        return winner, TERMINATIONS[int(entry['termination'])]
+
+    def positions(self, game):
+        """
+        Yields (board, move) for every move of a game, where board is the (8, 8) position the move was played from.
+        """
+        chess = ChessGame()
+        for move in self.game_moves(game):
+            yield chess.board.copy(), move
+            chess.push(move)
+
+    def iter_positions(self):
+        """
+        Yields (board, move, winner) for every position of every game in the archive, one game at a time.
+        winner is 1 for a White win, -1 for a Black win and 0 otherwise.
+        """
+        for game in range(len(self)):
+            winner = int(self.index[game]['winner'])
+            for board, move in self.positions(game):
+                yield board, move, winner
+
+    def position(self, n):
+        """
+        Returns (board, move, winner) for the n-th position of the archive, e.g. for sampling a replay buffer.
+        """
+        game = int(np.searchsorted(self.position_offsets, n, side='right')) - 1
+        ply = n - int(self.position_offsets[game])
+        entry = self.index[game]
+        start = int(entry['offset'])
+        chess = ChessGame()
+        for action in self.moves[start:start + ply]:
+            chess.push(decode_action(action))
+        return chess.board.copy(), decode_action(self.moves[start + ply]), int(entry['winner'])
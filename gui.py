@@ -1,61 +1,132 @@
+import copy
+import functools
+import io
+import os
+import queue
+import random
+import threading
 import tkinter as tk
 from PIL import ImageTk, Image
 from chess import ChessGame
-import random
+from selfplay import random_policy
+
+try:
+    import cairosvg
+except ImportError:
+    cairosvg = None
 
 PhotoImage = ImageTk.PhotoImage
 SPRITE_SIZE = 100
 SQUARE_COUNT = 8
 SQUARE_SIZE = 100  # pixels
+SPRITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maestro')
+SPRITE_NAMES = {1: 'wP', 2: 'wR', 3: 'wN', 4: 'wB', 5: 'wQ', 6: 'wK',
+                -1: 'bP', -2: 'bR', -3: 'bN', -4: 'bB', -5: 'bQ', -6: 'bK'}
+ENGINE_POLL_MS = 20
 
 
 class Chess:
-    def __init__(self):
+    """
+    A window to play or watch a game.
+    white and black are None for a human player, or an engine called as engine(game, rng) that returns a move, like
+    the self-play policies. Engines run on a background thread so the window stays responsive while they think.
+    The board is drawn once; after each move only the squares that changed are updated.
+    """
+
+    def __init__(self, white=None, black=random_policy, seed=None):
         super().__init__()
         self.chess = ChessGame()
+        self.engines = {'White': white, 'Black': black}
+        self.rng = random.Random(seed)
         self.window = tk.Tk()
         self.window.attributes("-topmost", True)
         self.canvas = tk.Canvas(height=SQUARE_COUNT * SQUARE_SIZE, width=SQUARE_COUNT * SQUARE_SIZE)
         self.canvas.bind("<Button-1>", self.interact)
         self.canvas.pack()
         self.first_click = None
-        bB, bN, bK, bQ, bP, bR, wB, wR, wK, wQ, wP, wN = load_images()
-        self.sprite_dict = {1: wP, 2: wR, 3: wN, 4: wB, 5: wQ, 6: wK, -1: bP, -2: bR, -3: bN, -4: bB, -5: bQ, -6: bK}
+        self.sprite_dict = load_images(SPRITE_SIZE)
+
+        # Canvas items: one rectangle per square, and the image of the piece on each square (None if empty).
+        self.squares = [[None] * SQUARE_COUNT for _ in range(SQUARE_COUNT)]
+        self.piece_items = [[None] * SQUARE_COUNT for _ in range(SQUARE_COUNT)]
+        # The board as currently drawn, to find the squares a move changed.
+        self.shown = None
+        self.thinking = False
+        self.replies = queue.Queue()
 
     def run(self):
         self.draw_board()
+        self.start_engine()
         self.window.mainloop()
 
+    def square_color(self, row, col):
+        if (row, col) == self.first_click:
+            return 'red'
+        return 'white' if (row + col) % 2 == 0 else 'green'
+
     def draw_board(self):
+        """
+        Creates the canvas items for every square and piece.
+        """
         self.canvas.delete("all")
         for row in range(SQUARE_COUNT):
             for col in range(SQUARE_COUNT):
                 x1 = col * SQUARE_SIZE
                 y1 = row * SQUARE_SIZE
-                x2 = x1 + SQUARE_SIZE
-                y2 = y1 + SQUARE_SIZE
-                if (row, col) == self.first_click:
-                    color = 'red'
-                elif (row + col) % 2 == 0:
-                    color = 'white'
-                else:
-                    color = 'green'
-                self.canvas.create_rectangle(x1, y1, x2, y2, fill=color)
-                piece = self.chess.board[row][col]
-                if piece != 0:
-                    self.canvas.create_image(x1 + SQUARE_SIZE / 2, y1 + SQUARE_SIZE / 2, image=self.sprite_dict[piece])
-        self.window.update()
+                self.squares[row][col] = self.canvas.create_rectangle(x1, y1, x1 + SQUARE_SIZE, y1 + SQUARE_SIZE,
+                                                                      fill=self.square_color(row, col))
+                self.piece_items[row][col] = None
+        self.shown = [[0] * SQUARE_COUNT for _ in range(SQUARE_COUNT)]
+        self.update_board()
+
+    def update_board(self):
+        """
+        Brings the pieces on the canvas in line with the game, touching only the squares that changed.
+        """
+        board = self.chess.board.tolist()
+        for row in range(SQUARE_COUNT):
+            for col in range(SQUARE_COUNT):
+                piece = board[row][col]
+                if piece != self.shown[row][col]:
+                    self.draw_piece(row, col, piece)
+        self.shown = board
+
+    def draw_piece(self, row, col, piece):
+        item = self.piece_items[row][col]
+        if piece == 0:
+            if item is not None:
+                self.canvas.delete(item)
+                self.piece_items[row][col] = None
+        elif item is None:
+            self.piece_items[row][col] = self.canvas.create_image(col * SQUARE_SIZE + SQUARE_SIZE / 2,
+                                                                  row * SQUARE_SIZE + SQUARE_SIZE / 2,
+                                                                  image=self.sprite_dict[piece])
+        else:
+            self.canvas.itemconfigure(item, image=self.sprite_dict[piece])
+
+    def select(self, square):
+        """
+        Moves the highlight to square, or removes it if square is None.
+        """
+        previous = self.first_click
+        self.first_click = square
+        for changed in (previous, square):
+            if changed is not None:
+                row, col = changed
+                self.canvas.itemconfigure(self.squares[row][col], fill=self.square_color(row, col))
 
     def interact(self, event):
+        if self.thinking or self.chess.termination is not None or self.engines[self.chess.to_move] is not None:
+            return
         col = event.x // SQUARE_SIZE
         row = event.y // SQUARE_SIZE
 
         if self.first_click is None:
-            self.first_click = (row, col)
+            self.select((row, col))
 
         else:
             piece, move_from, move_to = (self.chess.board[self.first_click[0], self.first_click[1]], self.first_click, (row, col))
-            self.first_click = None
+            self.select(None)
 
             # Check the player is moving the correct colour.
             if self.chess.to_move == 'White' and piece < 0:
@@ -65,38 +136,74 @@ class Chess:
             # Update the board
             else:
                 self.chess.update(piece, move_from, move_to)
-                random_move = random.choice(self.chess.return_legal_moves())
-                piece = self.chess.board[random_move[0], random_move[1]]
-                move_from = (random_move[0], random_move[1])
-                move_to = (random_move[2], random_move[3])
-                self.chess.update(piece, move_from, move_to)
-        self.draw_board()
-        self.window.update()
-
-
-def load_images():
-    bB = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/bB.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    bN = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/bN.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    bK = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/bK.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    bQ = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/bQ.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    bP = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/bP.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    bR = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/bR.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    wB = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/wB.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    wR = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/wR.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    wK = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/wK.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    wQ = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/wQ.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    wP = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/wP.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    wN = PhotoImage(
-        Image.open("C:/Users/Brody/Documents/GitHub/Chess-RL/maestro/wN.bmp").resize((SPRITE_SIZE, SPRITE_SIZE)))
-    return bB, bN, bK, bQ, bP, bR, wB, wR, wK, wQ, wP, wN
+                self.after_move()
+
+    def start_engine(self):
+        """
+        Starts the engine of the side to move thinking on a background thread, if that side is an engine.
+        Engines push and pop moves while they search, so the thread is given its own copy of the game; the move is
+        played on the Tk thread once it is found.
+        """
+        engine = self.engines[self.chess.to_move]
+        if engine is None or self.thinking or self.chess.termination is not None:
+            return
+        self.thinking = True
+        game = copy.deepcopy(self.chess)
+
+        def think():
+            try:
+                self.replies.put(('move', engine(game, self.rng)))
+            except Exception as error:
+                self.replies.put(('error', error))
+
+        threading.Thread(target=think, daemon=True).start()
+        self.window.after(ENGINE_POLL_MS, self.poll_engine)
+
+    def poll_engine(self):
+        try:
+            kind, reply = self.replies.get_nowait()
+        except queue.Empty:
+            self.window.after(ENGINE_POLL_MS, self.poll_engine)
+            return
+        self.thinking = False
+        if kind == 'error':
+            raise reply
+        piece = self.chess.board[reply[0], reply[1]]
+        self.chess.update(piece, (reply[0], reply[1]), (reply[2], reply[3]))
+        self.after_move()
+
+    def after_move(self):
+        """
+        Redraws the changed squares, then announces the result if the game is over or lets the next engine move.
+        """
+        self.update_board()
+        termination = self.chess.termination
+        if termination is None:
+            self.start_engine()
+            return
+        if self.chess.winner is not None:
+            message = "%s wins." % self.chess.winner
+        else:
+            message = "Draw by %s." % termination.replace('_', ' ')
+        print(message)
+        self.window.title(message)
+
+
+@functools.lru_cache(maxsize=None)
+def load_sprite(name, size):
+    """
+    Returns the PIL image of a piece sprite from SPRITE_DIR at size x size pixels, cached by name and size.
+    Uses the SVG if cairosvg is installed, so large boards stay sharp, and the BMP otherwise.
+    """
+    svg = os.path.join(SPRITE_DIR, name + ".svg")
+    if cairosvg is not None and os.path.exists(svg):
+        png = cairosvg.svg2png(url=svg, output_width=size, output_height=size)
+        return Image.open(io.BytesIO(png)).convert('RGBA')
+    return Image.open(os.path.join(SPRITE_DIR, name + ".bmp")).resize((size, size))
+
+
+def load_images(size=SPRITE_SIZE):
+    """
+    Returns a PhotoImage of each piece code at the given size. Needs a Tk window to exist.
+    """
+    return {piece: PhotoImage(load_sprite(name, size)) for piece, name in SPRITE_NAMES.items()}
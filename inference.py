@@ -0,0 +1,239 @@
+import argparse
+import collections
+import threading
+import time
+
+import numpy as np
+
+import encoder
+from vector_env import ACTION_SIZE
+
+# Upper edges of the latency histogram buckets, in seconds. The last bucket counts everything slower.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Value of each piece code for the CPU stand-in evaluator.
+PIECE_VALUES = np.array([1, 5, 3, 3, 9, 0], dtype=np.float32)
+
+
+class CPUEvaluator:
+    """
+    Stand-in for a network so the server can be run and tested without one.
+    Returns zero policy logits (uniform priors) and a value from the material balance, squashed into [-1, 1], for
+    the side to move. seconds_per_batch and seconds_per_position add a sleep to mimic the cost of a model.
+    A batch evaluator is called as evaluator(planes, masks) with an (N, NUM_PLANES, 8, 8) float32 array and an
+    (N, ACTION_SIZE) boolean legal move mask, and returns (logits, values): (N, ACTION_SIZE) policy logits and (N,)
+    values for the side to move. Both inputs are views of buffers reused for the next batch, so the evaluator must
+    copy anything it keeps.
+    """
+
+    def __init__(self, seconds_per_batch=0.0, seconds_per_position=0.0):
+        self.seconds_per_batch = seconds_per_batch
+        self.seconds_per_position = seconds_per_position
+
+    def __call__(self, planes, masks):
+        n = len(planes)
+        if self.seconds_per_batch or self.seconds_per_position:
+            time.sleep(self.seconds_per_batch + self.seconds_per_position * n)
+        counts = planes[:, :12].sum(axis=(2, 3))
+        material = counts[:, :6] @ PIECE_VALUES - counts[:, 6:] @ PIECE_VALUES
+        side = np.where(planes[:, encoder.SIDE_PLANE, 0, 0] > 0, 1.0, -1.0)
+        return np.zeros((n, ACTION_SIZE), dtype=np.float32), np.tanh(material * side / 10.0)
+
+
+class _Request:
+    __slots__ = ('game', 'moves', 'submitted', 'done', 'priors', 'value', 'error')
+
+    def __init__(self, game, moves):
+        self.game = game
+        self.moves = moves
+        self.submitted = time.perf_counter()
+        self.done = threading.Event()
+        self.priors = None
+        self.value = None
+        self.error = None
+
+
+class InferenceServer:
+    """
+    Collects evaluation requests from many search threads and runs them through a batch evaluator together.
+    A batch is sent once max_batch_size requests are waiting or the oldest has waited max_latency seconds.
+    The server is itself an evaluator for MCTS (server(game, moves) -> (priors, value)), so every search thread can
+    share one server. The calling thread blocks until its result is ready; the position is encoded straight from
+    the game while it waits, so the game must not change until the call returns.
+    """
+
+    def __init__(self, evaluator=None, max_batch_size=32, max_latency=0.005):
+        '''
+        evaluator: callable(planes, masks) -> (logits, values), see CPUEvaluator; defaults to CPUEvaluator()
+        max_batch_size: largest number of positions evaluated in one call
+        max_latency: longest time in seconds a request waits for a batch to fill
+        '''
+        self.evaluator = evaluator if evaluator is not None else CPUEvaluator()
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.planes = encoder.planes_buffer(max_batch_size)
+        self.masks = np.zeros((max_batch_size, ACTION_SIZE), dtype=bool)
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self.reset_stats()
+        self._thread = threading.Thread(target=self._serve, name='inference-server', daemon=True)
+        self._thread.start()
+
+    def reset_stats(self):
+        """
+        Clears the batch size and latency counters.
+        """
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = np.zeros(self.max_batch_size + 1, dtype=np.int64)
+        self.latency_counts = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.evaluator_seconds = 0.0
+
+    @property
+    def queue_depth(self):
+        """
+        Number of requests waiting for a batch.
+        """
+        return len(self._pending)
+
+    def __call__(self, game, moves):
+        request = _Request(game, moves)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("inference server is closed")
+            self._pending.append(request)
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.priors, request.value
+
+    def _next_batch(self):
+        """
+        Waits for a batch to fill or time out and takes it off the queue. Returns None once closed and drained.
+        """
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0].submitted + self.max_latency
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            count = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _serve(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._evaluate(batch)
+            except Exception as error:
+                for request in batch:
+                    request.error = error
+            finished = time.perf_counter()
+            for request in batch:
+                latency = finished - request.submitted
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                self.latency_counts[np.searchsorted(LATENCY_BUCKETS, latency)] += 1
+                request.done.set()
+            self.requests += len(batch)
+            self.batches += 1
+            self.batch_sizes[len(batch)] += 1
+
+    def _evaluate(self, batch):
+        n = len(batch)
+        planes = self.planes[:n]
+        for k, request in enumerate(batch):
+            encoder.encode_game(request.game, planes[k])
+        move_lists = [request.moves for request in batch]
+        masks = encoder.legal_move_mask(move_lists, self.masks)
+        start = time.perf_counter()
+        logits, values = self.evaluator(planes, masks)
+        self.evaluator_seconds += time.perf_counter() - start
+        for k, request in enumerate(batch):
+            move_logits = np.asarray(logits[k], dtype=np.float32)[encoder.encode_moves(request.moves)]
+            priors = np.exp(move_logits - move_logits.max())
+            request.priors = priors / priors.sum()
+            request.value = float(values[k])
+
+    def stats(self):
+        """
+        Returns the counters as a dict: queue depth, requests and batches served, the batch size histogram (count of
+        batches by size), mean batch size, the request latency histogram over LATENCY_BUCKETS, and mean and maximum
+        latency in seconds from a request being made to its result being ready.
+        """
+        return {
+            'queue_depth': self.queue_depth,
+            'requests': self.requests,
+            'batches': self.batches,
+            'batch_sizes': self.batch_sizes.tolist(),
+            'mean_batch_size': self.requests / max(self.batches, 1),
+            'latency_buckets': list(LATENCY_BUCKETS),
+            'latency_counts': self.latency_counts.tolist(),
+            'mean_latency': self.latency_total / max(self.requests, 1),
+            'max_latency': self.latency_max,
+            'evaluator_seconds': self.evaluator_seconds,
+        }
+
+    def close(self):
+        """
+        Serves the requests still waiting and stops the server thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    from chess import ChessGame
+    from mcts import MCTS
+
+    parser = argparse.ArgumentParser(description="Run MCTS searches in threads sharing one batched inference server.")
+    parser.add_argument('--threads', type=int, default=8, help="number of search threads")
+    parser.add_argument('--simulations', type=int, default=100, help="MCTS simulations per thread")
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-latency', type=float, default=0.005, help="seconds a request may wait for a batch")
+    parser.add_argument('--batch-cost', type=float, default=0.002, help="simulated seconds per evaluator call")
+    args = parser.parse_args(argv)
+
+    server = InferenceServer(CPUEvaluator(seconds_per_batch=args.batch_cost), args.batch_size, args.max_latency)
+    threads = [threading.Thread(target=lambda: MCTS(server, num_simulations=args.simulations).search(ChessGame()))
+               for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.close()
+
+    stats = server.stats()
+    print("%d evaluations in %d batches in %.2fs (%.0f evaluations/s)" % (stats['requests'], stats['batches'], elapsed,
+                                                                         stats['requests'] / elapsed))
+    print("mean batch size %.2f, mean latency %.2fms, max latency %.2fms" % (stats['mean_batch_size'],
+                                                                            stats['mean_latency'] * 1000,
+                                                                            stats['max_latency'] * 1000))
+    print("batch sizes: %s" % ', '.join('%d: %d' % (size, count) for size, count in enumerate(stats['batch_sizes'])
+                                        if count))
+
+
+if __name__ == "__main__":
+    main()
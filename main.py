@@ -1,10 +1,182 @@
-from gui import Chess
+import argparse
+import os
+import random
+import sys
+import time
 
+from chess import ChessGame, move_to_uci, uci_to_move
+import selfplay
 
-def main():
-    # Create a new chess board object.
-    chess = Chess()
+RESULT_TOKENS = {'White': '1-0', 'Black': '0-1'}
+
+
+def result_token(record):
+    """
+    Returns the PGN style result of a finished game record: 1-0, 0-1, 1/2-1/2 or * if it was cut off.
+    """
+    if record['winner']:
+        return RESULT_TOKENS[record['winner']]
+    return '*' if record['result'] in ('max_plies', 'unfinished') else '1/2-1/2'
+
+
+ENGINES = ('random', 'mcts', 'alphabeta')
+
+
+def make_policy(engine, args):
+    """
+    Returns the policy (game, rng) -> move for an engine name, configured from the command line options.
+    """
+    if engine == 'mcts':
+        from mcts import MCTSPolicy
+        return MCTSPolicy(num_simulations=args.simulations, seed=args.seed)
+    if engine == 'alphabeta':
+        from alphabeta import AlphaBeta
+        return AlphaBeta(args.depth, args.move_time)
+    return selfplay.random_policy
+
+
+def run_gui(args):
+    # Imported here so the headless commands never load tkinter or PIL.
+    from gui import Chess
+    white = getattr(args, 'white', 'human')
+    black = getattr(args, 'black', 'random')
+    chess = Chess(None if white == 'human' else make_policy(white, args),
+                  None if black == 'human' else make_policy(black, args), getattr(args, 'seed', None))
     chess.run()
 
+
+def run_play(args):
+    """
+    Plays games without the GUI and optionally writes them one per line as coordinate moves and a result.
+    """
+    policy = make_policy(args.engine, args)
+    rng = random.Random(args.seed)
+    output = open(args.output, 'w') if args.output else None
+    archive = None
+    if args.archive:
+        from gamerecord import GameWriter
+        archive = GameWriter(args.archive)
+    start = time.perf_counter()
+    plies = 0
+    try:
+        for index in range(args.games):
+            record = selfplay.play_game(policy, rng, args.max_plies)
+            plies += len(record['moves'])
+            print("game %d: %s after %d plies (%s)" % (index + 1, result_token(record), len(record['moves']),
+                                                       record['result']))
+            if output is not None:
+                output.write(' '.join([move_to_uci(move) for move in record['moves']] + [result_token(record)]))
+                output.write('\n')
+            if archive is not None:
+                archive.write_record(record)
+    finally:
+        if output is not None:
+            output.close()
+        if archive is not None:
+            archive.close()
+    elapsed = time.perf_counter() - start
+    print("%d games, %d plies in %.2fs (%.0f plies/s)" % (args.games, plies, elapsed, plies / max(elapsed, 1e-9)))
+
+
+def run_replay(args):
+    """
+    Replays games written by the play command, checking every move is legal, and prints the final positions.
+    file is either a text file of coordinate moves or the path of a game archive (without .moves/.index).
+    """
+    for index, (moves, result) in enumerate(read_games(args.file)):
+        game = ChessGame()
+        for ply, move in enumerate(moves):
+            if move not in game.return_legal_moves():
+                raise SystemExit("game %d, ply %d: illegal move %s" % (index + 1, ply + 1, move_to_uci(move)))
+            game.push(move)
+        print("game %d: %d plies, %s" % (index + 1, len(moves), result))
+        if args.show:
+            print(game)
+
+
+def read_games(path):
+    """
+    Yields (moves, result token) for each game in a text file or game archive.
+    """
+    if os.path.exists(path + '.index'):
+        from gamerecord import GameArchive
+        archive = GameArchive(path)
+        for game in range(len(archive)):
+            winner, termination = archive.game_result(game)
+            yield archive.game_moves(game), result_token({'winner': winner, 'result': termination})
+        return
+    with open(path) as games:
+        for line in games:
+            tokens = line.split()
+            if not tokens:
+                continue
+            result = tokens.pop() if tokens[-1] in ('1-0', '0-1', '1/2-1/2', '*') else '*'
+            yield [uci_to_move(token) for token in tokens], result
+
+
+def run_bench(args):
+    """
+    Runs the perft suite and times random self-play.
+    """
+    import perft
+    mismatches = perft.run(list(perft.POSITIONS), args.depth)
+    start = time.perf_counter()
+    plies = 0
+    rng = random.Random(0)
+    for _ in range(args.games):
+        plies += len(selfplay.play_game(rng=rng, max_plies=args.max_plies)['moves'])
+    elapsed = time.perf_counter() - start
+    print("self-play: %d games, %d plies in %.2fs (%.0f plies/s)" % (args.games, plies, elapsed,
+                                                                     plies / max(elapsed, 1e-9)))
+    return 1 if mismatches else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chess-RL. With no command, opens the GUI.")
+    commands = parser.add_subparsers(dest='command')
+
+    gui = commands.add_parser('gui', help="play against an engine, or watch two engines, in a window")
+    gui.add_argument('--white', choices=('human',) + ENGINES, default='human')
+    gui.add_argument('--black', choices=('human',) + ENGINES, default='random')
+
+    play = commands.add_parser('play', help="play games headlessly")
+    play.add_argument('--games', type=int, default=1)
+    play.add_argument('--engine', choices=ENGINES, default='random')
+    play.add_argument('--max-plies', type=int, default=selfplay.MAX_PLIES)
+
+    for command in (gui, play):
+        command.add_argument('--simulations', type=int, default=200, help="MCTS simulations per move")
+        command.add_argument('--depth', type=int, default=3, help="alpha-beta search depth")
+        command.add_argument('--move-time', type=float, default=None, help="alpha-beta seconds per move")
+        command.add_argument('--seed', type=int, default=None)
+    play.add_argument('--output', help="text file to write the games to")
+    play.add_argument('--archive', help="game archive to append the games to (see gamerecord.py)")
+
+    replay = commands.add_parser('replay', help="replay games written by play")
+    replay.add_argument('file', help="text file or game archive path")
+    replay.add_argument('--show', action='store_true', help="print the final position of each game")
+
+    bench = commands.add_parser('bench', help="run the perft suite and time self-play")
+    bench.add_argument('--depth', type=int, default=3)
+    bench.add_argument('--games', type=int, default=10)
+    bench.add_argument('--max-plies', type=int, default=selfplay.MAX_PLIES)
+
+    for command in (play, replay, bench):
+        command.add_argument('--profile', metavar='PATH',
+                             help="time the rules engine and write a report to PATH (.csv or .json)")
+
+    args = parser.parse_args(argv)
+    run = {'play': run_play, 'replay': run_replay, 'bench': run_bench}.get(args.command, run_gui)
+    if not getattr(args, 'profile', None):
+        return run(args)
+    from profiling import Profiler
+    profiler = Profiler()
+    with profiler:
+        status = run(args)
+    profiler.write(args.profile)
+    print(profiler.summary())
+    return status
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
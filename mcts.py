@@ -0,0 +1,318 @@
+import math
+import random
+import time
+
+import numpy as np
+
+from vector_env import decode_action, encode_move
+
+# How many plies search() looks back through the game for the position its tree was built for.
+MAX_FOLLOW = 4
+
+
+def uniform_evaluator(game, moves):
+    """
+    Gives every legal move the same prior and the position a value of 0.
+    An evaluator is called as evaluator(game, moves) and returns (priors, value): one prior per move in moves and
+    the value of the position in [-1, 1] for the side to move. It may push and pop moves but must leave the game
+    as it found it.
+    """
+    return np.full(len(moves), 1.0 / len(moves), dtype=np.float32), 0.0
+
+
+class RolloutEvaluator:
+    """
+    Uniform priors, valued by random playouts: 1 if the side to move mates, -1 if it is mated, 0 otherwise.
+    """
+
+    def __init__(self, max_plies=40, seed=None):
+        self.max_plies = max_plies
+        self.rng = random.Random(seed)
+
+    def __call__(self, game, moves):
+        priors = np.full(len(moves), 1.0 / len(moves), dtype=np.float32)
+        color = game.to_move
+        value = 0.0
+        played = 0
+        for _ in range(self.max_plies):
+            legal = moves if played == 0 else game.return_legal_moves()
+            if not legal:
+                if game.in_check(game.to_move):
+                    value = -1.0 if game.to_move == color else 1.0
+                break
+            if played and game.draw_reason() is not None:
+                break
+            game.push(self.rng.choice(legal))
+            played += 1
+        for _ in range(played):
+            game.pop()
+        return priors, value
+
+
+class MCTS:
+    """
+    Monte Carlo Tree Search with PUCT selection over ChessGame.
+    Nodes live in flat numpy arrays rather than one Python object per node. The children of a node are stored in a
+    contiguous block starting at first_child[node]. Each node's value_sum is from the point of view of the player
+    who made the move leading to it.
+    After a move is played, advance(move) keeps the subtree below it and discards the rest of the tree.
+    """
+
+    def __init__(self, evaluator=uniform_evaluator, num_simulations=800, time_limit=None, c_puct=1.5,
+                 dirichlet_alpha=None, noise_fraction=0.25, capacity=1 << 16, seed=None):
+        '''
+        evaluator: callable(game, moves) -> (priors, value), see uniform_evaluator
+        num_simulations: simulations per search
+        time_limit: seconds per search, None for no limit; the search stops at whichever limit comes first
+        c_puct: exploration constant
+        dirichlet_alpha: if set, Dirichlet noise with this alpha is mixed into the root priors of each search
+        noise_fraction: weight of the Dirichlet noise
+        capacity: initial number of nodes allocated; the arrays grow as needed
+        '''
+        self.evaluator = evaluator
+        self.num_simulations = num_simulations
+        self.time_limit = time_limit
+        self.c_puct = c_puct
+        self.dirichlet_alpha = dirichlet_alpha
+        self.noise_fraction = noise_fraction
+        self.np_random = np.random.default_rng(seed)
+        self._allocate(capacity)
+        self.root_key = None
+        self.last_search = {}
+
+    def _allocate(self, capacity):
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.move = np.zeros(capacity, dtype=np.int16)
+        self.prior = np.zeros(capacity, dtype=np.float32)
+        self.visits = np.zeros(capacity, dtype=np.int32)
+        self.value_sum = np.zeros(capacity, dtype=np.float32)
+        self.first_child = np.full(capacity, -1, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int16)
+        self.expanded = np.zeros(capacity, dtype=bool)
+        # Value for the side to move at an expanded node without children (checkmate, stalemate or a drawn position).
+        self.terminal_value = np.zeros(capacity, dtype=np.float32)
+        self.size = 1
+        self.root = 0
+        # The root's priors before Dirichlet noise, set by the first search that adds noise at this root.
+        self.root_prior = None
+
+    _ARRAYS = ('parent', 'move', 'prior', 'visits', 'value_sum', 'first_child', 'num_children', 'expanded',
+               'terminal_value')
+
+    def _reserve(self, count):
+        """
+        Makes sure count more nodes fit, doubling the arrays if they do not.
+        """
+        capacity = len(self.parent)
+        if self.size + count <= capacity:
+            return
+        while capacity < self.size + count:
+            capacity *= 2
+        for name in self._ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            if name in ('parent', 'first_child'):
+                new.fill(-1)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def reset(self):
+        """
+        Discards the whole tree.
+        """
+        self._allocate(len(self.parent))
+        self.root_key = None
+
+    def _expand(self, node, game):
+        """
+        Adds the children of a leaf and returns its value for the side to move.
+        """
+        moves = game.return_legal_moves()
+        self.expanded[node] = True
+        if not moves or game.draw_reason() is not None:
+            # Checkmate, stalemate or a draw by rule: a terminal node without children.
+            value = -1.0 if not moves and game.in_check(game.to_move) else 0.0
+            self.terminal_value[node] = value
+            return value
+        priors, value = self.evaluator(game, moves)
+        count = len(moves)
+        self._reserve(count)
+        start = self.size
+        end = start + count
+        self.parent[start:end] = node
+        self.move[start:end] = [encode_move(move) for move in moves]
+        self.prior[start:end] = priors
+        self.first_child[node] = start
+        self.num_children[node] = count
+        self.size = end
+        return value
+
+    def _select_child(self, node):
+        start = self.first_child[node]
+        end = start + self.num_children[node]
+        visits = self.visits[start:end]
+        q = np.divide(self.value_sum[start:end], visits, out=np.zeros(end - start, dtype=np.float32),
+                      where=visits > 0)
+        u = self.c_puct * self.prior[start:end] * (math.sqrt(max(self.visits[node], 1)) / (1.0 + visits))
+        return start + int(np.argmax(q + u))
+
+    def _simulate(self, game):
+        node = self.root
+        path = [node]
+        while self.expanded[node] and self.num_children[node] > 0:
+            node = self._select_child(node)
+            game.push(decode_action(self.move[node]))
+            path.append(node)
+
+        if self.expanded[node]:
+            value = float(self.terminal_value[node])
+        else:
+            value = self._expand(node, game)
+
+        for node in reversed(path):
+            # value is for the side to move at node, value_sum is for the player who moved into it.
+            value = -value
+            self.visits[node] += 1
+            self.value_sum[node] += value
+        for _ in range(len(path) - 1):
+            game.pop()
+
+    def _add_noise(self):
+        """
+        Mixes new Dirichlet noise into the root's priors, starting from the priors without noise each time so noise
+        from earlier searches of the same root does not pile up.
+        """
+        start = self.first_child[self.root]
+        end = start + self.num_children[self.root]
+        if self.root_prior is None:
+            self.root_prior = self.prior[start:end].copy()
+        noise = self.np_random.dirichlet([self.dirichlet_alpha] * (end - start))
+        self.prior[start:end] = (1 - self.noise_fraction) * self.root_prior + self.noise_fraction * noise
+
+    def search(self, game):
+        """
+        Runs simulations from the position of game and returns the most visited move, or None if the game is over:
+        no legal moves, or drawn by rule. The game is left as it was. If game is not the position the tree was built
+        for, the tree is discarded first, unless the moves played since then can be followed down the tree (see
+        _follow).
+        """
+        if self.root_key != game.zobrist:
+            if not self._follow(game):
+                self.reset()
+            self.root_key = game.zobrist
+        start = time.perf_counter()
+        if not self.expanded[self.root]:
+            self._simulate(game)
+        if self.num_children[self.root] == 0:
+            return None
+        if self.dirichlet_alpha is not None:
+            self._add_noise()
+
+        simulations = 0
+        while simulations < self.num_simulations:
+            if self.time_limit is not None and time.perf_counter() - start >= self.time_limit:
+                break
+            self._simulate(game)
+            simulations += 1
+
+        elapsed = time.perf_counter() - start
+        self.last_search = {'simulations': simulations, 'seconds': elapsed, 'nodes': self.size,
+                            'root_visits': int(self.visits[self.root])}
+        moves, visits = self.root_policy()
+        return moves[int(np.argmax(visits))]
+
+    def _follow(self, game):
+        """
+        Moves the root along the moves played since the tree was built, if its position is one of the last
+        MAX_FOLLOW positions of game, e.g. after the opponent replied to the tree's own move. Returns False if not.
+        """
+        stack = game.undo_stack
+        for back in range(1, min(MAX_FOLLOW, len(stack)) + 1):
+            if stack[-back][4] == self.root_key:
+                for ply in range(back, 0, -1):
+                    self.advance(game.played_move(ply))
+                return True
+        return False
+
+    def root_policy(self):
+        """
+        Returns the root's moves and their visit counts, e.g. as a policy target for training.
+        """
+        start = self.first_child[self.root]
+        end = start + self.num_children[self.root]
+        return [decode_action(action) for action in self.move[start:end]], self.visits[start:end].copy()
+
+    def advance(self, move, game=None):
+        """
+        Moves the root to the child reached by move and drops every node outside that subtree.
+        Call it for every move played in the game, by either side. If game is given, it must be the position after
+        the move; its key is kept as the root's, so the next search can keep the tree without looking back.
+        """
+        child = -1
+        if self.expanded[self.root]:
+            start = self.first_child[self.root]
+            end = start + self.num_children[self.root]
+            matches = np.flatnonzero(self.move[start:end] == encode_move(move))
+            if len(matches):
+                child = start + int(matches[0])
+        if child < 0:
+            self.reset()
+            return
+        self._compact(child)
+        self.root_key = game.zobrist if game is not None else None
+
+    def _compact(self, new_root):
+        """
+        Copies the subtree under new_root to the front of the arrays, keeping each block of children contiguous.
+        """
+        old_ids = [new_root]
+        first_child = [-1]
+        parent = [-1]
+        index = 0
+        while index < len(old_ids):
+            node = old_ids[index]
+            count = int(self.num_children[node])
+            if count:
+                start = int(self.first_child[node])
+                first_child[index] = len(old_ids)
+                old_ids.extend(range(start, start + count))
+                first_child.extend([-1] * count)
+                parent.extend([index] * count)
+            index += 1
+
+        old_ids = np.array(old_ids)
+        size = len(old_ids)
+        for name in self._ARRAYS:
+            array = getattr(self, name)
+            array[:size] = array[old_ids]
+        self.first_child[:size] = first_child
+        self.parent[:size] = parent
+        self.parent[size:self.size] = -1
+        self.first_child[size:self.size] = -1
+        self.num_children[size:self.size] = 0
+        self.expanded[size:self.size] = False
+        self.visits[size:self.size] = 0
+        self.value_sum[size:self.size] = 0
+        self.terminal_value[size:self.size] = 0
+        self.size = size
+        self.root = 0
+        self.root_prior = None
+
+
+class MCTSPolicy:
+    """
+    Adapts MCTS to the self-play policy interface policy(game, rng), reusing the tree from move to move.
+    Returns None if the game is over, like MCTS.search. Keyword arguments are passed to MCTS.
+    """
+
+    def __init__(self, **kwargs):
+        self.tree = MCTS(**kwargs)
+
+    def __call__(self, game, rng=None):
+        move = self.tree.search(game)
+        if move is None:
+            return None
+        game.push(move)
+        self.tree.advance(move, game)
+        game.pop()
+        return move
@@ -0,0 +1,62 @@
+import argparse
+import sys
+import time
+
+from chess import ChessGame
+
+# Standard perft positions with their published node counts, indexed by depth - 1.
+# ChessGame only promotes to a queen, so counts are listed only for depths without promotions.
+POSITIONS = {
+    'start': ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+              [20, 400, 8902, 197281, 4865609]),
+    'kiwipete': ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                 [48, 2039, 97862]),
+    'position3': ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+                  [14, 191, 2812, 43238, 674624]),
+    'position4': ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+                  [6]),
+    'position6': ('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+                  [46, 2079, 89890, 3894594]),
+}
+
+
+def run(names, max_depth):
+    """
+    Runs perft on the named positions up to max_depth (or the deepest known count) and prints the node counts,
+    time and nodes/second for each depth. Returns the number of counts that did not match the reference.
+    """
+    mismatches = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name in names:
+        fen, expected = POSITIONS[name]
+        game = ChessGame.from_fen(fen)
+        print("%s: %s" % (name, fen))
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            start = time.perf_counter()
+            nodes = game.perft(depth)
+            elapsed = time.perf_counter() - start
+            total_nodes += nodes
+            total_time += elapsed
+            status = 'ok' if nodes == expected[depth - 1] else 'MISMATCH (expected %d)' % expected[depth - 1]
+            if nodes != expected[depth - 1]:
+                mismatches += 1
+            print("  depth %d: %10d nodes %8.2fs %10.0f nodes/s  %s" % (depth, nodes, elapsed,
+                                                                        nodes / max(elapsed, 1e-9), status))
+    print("total: %d nodes in %.2fs (%.0f nodes/s), %d mismatches" % (total_nodes, total_time,
+                                                                       total_nodes / max(total_time, 1e-9),
+                                                                       mismatches))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and check the move generator with perft.")
+    parser.add_argument('--depth', type=int, default=3, help="deepest depth to run (default: 3)")
+    parser.add_argument('--position', action='append', choices=sorted(POSITIONS),
+                        help="position to run, may be repeated (default: all)")
+    args = parser.parse_args(argv)
+    return 1 if run(args.position or list(POSITIONS), args.depth) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import bisect
+import csv
+import functools
+import json
+import time
+
+import chess
+from chess import ChessGame
+
+# Methods timed by default.
+METHODS = ('can_move', 'legal_move', 'in_check', 'no_legal_moves', 'return_legal_moves', 'check_info', 'push', 'pop')
+# Module level functions of chess timed by default. Move generation finds each piece's targets with
+# pseudo_legal_targets, looked up as a global, so this is where the per piece type time of a search is spent.
+FUNCTIONS = ('pseudo_legal_targets',)
+# Timed calls that are also broken down by piece type, with how to find the piece code from the call's arguments
+# (self included for methods). can_move and legal_move only run from update(), e.g. for moves made in the GUI.
+PIECE_ARGUMENTS = {
+    'pseudo_legal_targets': lambda args: args[0][args[1]],
+    'can_move': lambda args: args[1],
+    'legal_move': lambda args: args[1],
+}
+PIECE_NAMES = {1: 'pawn', 2: 'rook', 3: 'knight', 4: 'bishop', 5: 'queen', 6: 'king'}
+
+# Upper edges of the latency histogram buckets, in microseconds. The last bucket counts everything slower.
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+class _Stats:
+    __slots__ = ('calls', 'total', 'own', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, elapsed, own):
+        self.calls += 1
+        self.total += elapsed
+        self.own += own
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, elapsed * 1e6)] += 1
+
+    def as_dict(self):
+        return {'calls': self.calls, 'total_seconds': self.total, 'self_seconds': self.own,
+                'mean_us': self.total / self.calls * 1e6 if self.calls else 0.0, 'histogram': list(self.histogram)}
+
+
+class Profiler:
+    """
+    Counts calls to ChessGame methods and chess module functions and times them, while enabled.
+    Enabling replaces the methods on the ChessGame class and the functions in the chess module with timing wrappers
+    and disabling puts the originals back, so there is no cost at all when profiling is off. Only one profiler can
+    be enabled at a time, and it is meant for single-threaded runs.
+    For each method it records the number of calls, total time (including the methods it calls), self time
+    (excluding the timed methods it calls) and a histogram of call latencies. pseudo_legal_targets, can_move and
+    legal_move are also recorded per piece type.
+
+        with Profiler() as profiler:
+            play_game()
+        profiler.write_json('profile.json')
+    """
+
+    _enabled = None
+
+    def __init__(self, methods=METHODS, functions=FUNCTIONS):
+        self.methods = tuple(methods)
+        self.functions = tuple(functions)
+        self.stats = {}
+        self.piece_stats = {}
+        self.originals = {}
+        self.seconds = 0.0
+        self._stack = []
+        self._start = None
+
+    def enable(self):
+        if Profiler._enabled is not None:
+            raise RuntimeError("another profiler is already enabled")
+        Profiler._enabled = self
+        for owner, names in ((ChessGame, self.methods), (chess, self.functions)):
+            for name in names:
+                original = getattr(owner, name)
+                self.originals[owner, name] = original
+                setattr(owner, name, self._wrap(name, original))
+        self._start = time.perf_counter()
+        return self
+
+    def disable(self):
+        if Profiler._enabled is not self:
+            return
+        for (owner, name), original in self.originals.items():
+            setattr(owner, name, original)
+        self.originals = {}
+        self.seconds += time.perf_counter() - self._start
+        Profiler._enabled = None
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def _wrap(self, name, original):
+        stats = self.stats.setdefault(name, _Stats())
+        piece_of = PIECE_ARGUMENTS.get(name)
+        piece_stats = self.piece_stats.setdefault(name, {}) if piece_of is not None else None
+        stack = self._stack
+        clock = time.perf_counter
+
+        @functools.wraps(original)
+        def timed(*args):
+            stack.append(0.0)
+            start = clock()
+            try:
+                return original(*args)
+            finally:
+                elapsed = clock() - start
+                own = elapsed - stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                stats.add(elapsed, own)
+                if piece_stats is not None:
+                    piece = PIECE_NAMES.get(abs(int(piece_of(args))), 'empty')
+                    if piece not in piece_stats:
+                        piece_stats[piece] = _Stats()
+                    piece_stats[piece].add(elapsed, own)
+
+        return timed
+
+    def report(self):
+        """
+        Returns the results as a dict: the seconds spent enabled, the histogram bucket edges in microseconds, and
+        per method (and per piece type for pseudo_legal_targets, can_move and legal_move) the calls, total and self
+        seconds, mean latency in microseconds and latency histogram.
+        """
+        return {
+            'seconds': self.seconds,
+            'latency_buckets_us': list(LATENCY_BUCKETS),
+            'methods': {name: stats.as_dict() for name, stats in self.stats.items()},
+            'pieces': {name: {piece: stats.as_dict() for piece, stats in pieces.items()}
+                       for name, pieces in self.piece_stats.items()},
+        }
+
+    def rows(self):
+        """
+        Yields one flat row per method and per (method, piece type), with piece 'all' for the method totals.
+        """
+        for name, stats in self.stats.items():
+            yield dict(method=name, piece='all', **stats.as_dict())
+            for piece, piece_stats in sorted(self.piece_stats.get(name, {}).items()):
+                yield dict(method=name, piece=piece, **piece_stats.as_dict())
+
+    def write_json(self, path):
+        with open(path, 'w') as output:
+            json.dump(self.report(), output, indent=2)
+
+    def write_csv(self, path):
+        """
+        Writes one line per row(), with a column for each latency histogram bucket.
+        """
+        buckets = ['le_%dus' % edge for edge in LATENCY_BUCKETS] + ['gt_%dus' % LATENCY_BUCKETS[-1]]
+        with open(path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(['method', 'piece', 'calls', 'total_seconds', 'self_seconds', 'mean_us'] + buckets)
+            for row in self.rows():
+                writer.writerow([row['method'], row['piece'], row['calls'], '%.6f' % row['total_seconds'],
+                                 '%.6f' % row['self_seconds'], '%.3f' % row['mean_us']] + row['histogram'])
+
+    def write(self, path):
+        """
+        Writes the report as CSV if path ends in .csv and as JSON otherwise.
+        """
+        if path.endswith('.csv'):
+            self.write_csv(path)
+        else:
+            self.write_json(path)
+
+    def summary(self):
+        """
+        Returns a text table of the methods sorted by self time.
+        """
+        lines = ["%-20s %-8s %10s %10s %10s %10s" % ('method', 'piece', 'calls', 'total s', 'self s', 'mean us')]
+        for row in sorted(self.rows(), key=lambda row: (-self.stats[row['method']].own, row['piece'] != 'all')):
+            lines.append("%-20s %-8s %10d %10.3f %10.3f %10.2f" % (row['method'], row['piece'], row['calls'],
+                                                                  row['total_seconds'], row['self_seconds'],
+                                                                  row['mean_us']))
+        return '\n'.join(lines)
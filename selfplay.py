@@ -0,0 +1,143 @@
+import argparse
+import multiprocessing as mp
+import os
+import random
+import time
+import traceback
+from queue import Empty
+
+from chess import CHECKMATE, ChessGame
+
+MAX_PLIES = 500
+# Seconds to wait for a message from the workers before checking whether any of them died.
+WORKER_POLL_SECONDS = 1.0
+
+
+def random_policy(game, rng):
+    """
+    Picks a uniformly random legal move. Also the GUI's default opponent.
+    """
+    return rng.choice(game.return_legal_moves())
+
+
+def play_game(policy=random_policy, rng=None, max_plies=MAX_PLIES):
+    """
+    Plays one game with policy choosing the moves for both sides.
+    policy is called as policy(game, rng) and must return one of game.return_legal_moves().
+    Returns a dict with the moves played, the winner ('White', 'Black' or None) and how the game ended: one of the
+    terminations of ChessGame.outcome(), or 'max_plies' if it was cut off.
+    """
+    if rng is None:
+        rng = random.Random()
+    game = ChessGame()
+    moves = []
+    result = 'max_plies'
+    winner = None
+    while len(moves) < max_plies:
+        termination = game.outcome()
+        if termination is not None:
+            result = termination
+            if termination == CHECKMATE:
+                winner = 'Black' if game.to_move == 'White' else 'White'
+            break
+        move = tuple(int(v) for v in policy(game, rng))
+        game.push(move)
+        moves.append(move)
+    return {'moves': moves, 'winner': winner, 'result': result}
+
+
+def _worker(worker_id, games, seed, policy, max_plies, queue):
+    """
+    Plays games in a worker process and sends each one to the parent as soon as it finishes.
+    """
+    try:
+        rng = random.Random(seed)
+        for index in range(games):
+            record = play_game(policy, rng, max_plies)
+            record['worker'] = worker_id
+            record['seed'] = seed
+            record['index'] = index
+            queue.put(('game', record))
+    except Exception:
+        queue.put(('error', (worker_id, traceback.format_exc())))
+    queue.put(('done', worker_id))
+
+
+def self_play(num_workers=None, games_per_worker=1, seed=0, policy=random_policy, max_plies=MAX_PLIES):
+    """
+    Runs self-play in a pool of worker processes and yields finished games as they arrive.
+    Worker k is seeded with seed + k, so a run is reproducible for a given seed, worker count and policy.
+    policy must be picklable (e.g. a module level function) so it can be sent to the workers.
+    Raises RuntimeError if a worker fails, including one killed without reporting (e.g. out of memory).
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    queue = mp.Queue()
+    workers = [mp.Process(target=_worker, args=(k, games_per_worker, seed + k, policy, max_plies, queue), daemon=True)
+               for k in range(num_workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        finished = set()
+        dead = set()
+        while len(finished) < num_workers:
+            try:
+                kind, payload = queue.get(timeout=WORKER_POLL_SECONDS)
+            except Empty:
+                # A worker flushes its messages before it exits, so one still silent a poll after it was found dead
+                # exited without reporting.
+                lost = sorted(dead - finished)
+                if lost:
+                    raise RuntimeError("self-play worker %d exited with code %s without finishing" % (
+                        lost[0], workers[lost[0]].exitcode))
+                dead = {k for k, worker in enumerate(workers) if k not in finished and not worker.is_alive()}
+                continue
+            if kind == 'game':
+                yield payload
+            elif kind == 'error':
+                worker_id, error = payload
+                raise RuntimeError("self-play worker %d failed:\n%s" % (worker_id, error))
+            else:
+                finished.add(payload)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play random self-play games on all cores.")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument('--games-per-worker', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES)
+    parser.add_argument('--output', help="game archive to append the games to (see gamerecord.py)")
+    args = parser.parse_args()
+
+    writer = None
+    if args.output:
+        from gamerecord import GameWriter
+        writer = GameWriter(args.output)
+
+    start = time.perf_counter()
+    games = plies = 0
+    results = {}
+    for record in self_play(args.workers, args.games_per_worker, args.seed, max_plies=args.max_plies):
+        games += 1
+        plies += len(record['moves'])
+        outcome = record['winner'] + " wins" if record['winner'] else record['result']
+        results[outcome] = results.get(outcome, 0) + 1
+        if writer is not None:
+            writer.write_record(record)
+    if writer is not None:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    print("%d games, %d plies in %.1fs (%.2f games/s, %.0f plies/s)" % (games, plies, elapsed, games / elapsed,
+                                                                       plies / elapsed))
+    for outcome, count in sorted(results.items()):
+        print("  %s: %d" % (outcome, count))
+
+
+if __name__ == "__main__":
+    main()
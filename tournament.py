@@ -0,0 +1,333 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+
+import numpy as np
+
+from chess import CHECKMATE, ChessGame, move_to_uci
+
+MAX_PLIES = 300
+
+
+class RandomAgent:
+    """
+    Plays a uniformly random legal move. Without a seed it uses the random module, which every worker process
+    reseeds, so copies of the agent in different workers do not play the same moves.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = None if seed is None else random.Random(seed)
+
+    def __call__(self, game):
+        return (self.rng or random).choice(game.return_legal_moves())
+
+
+def make_agent(spec):
+    """
+    Builds an agent from a command line spec: 'random', 'alphabeta[:depth]' or 'mcts[:simulations]'.
+    """
+    name, _, option = spec.partition(':')
+    if name == 'random':
+        return RandomAgent()
+    if name == 'alphabeta':
+        from alphabeta import AlphaBeta
+        return AlphaBeta(int(option or 2))
+    if name == 'mcts':
+        from mcts import MCTSPolicy
+        return MCTSPolicy(num_simulations=int(option or 100))
+    raise ValueError("unknown agent %r" % spec)
+
+
+def schedule(names, games_per_pair, mode='roundrobin'):
+    """
+    Returns the games of a tournament as (index, white, black, opening) tuples.
+    roundrobin pairs every agent with every other, gauntlet pairs the first agent with each of the others.
+    Each pair plays games_per_pair games alternating colours; every two games of a pair share an opening, so both
+    agents get it once with each colour. No opening is shared between pairs.
+    """
+    if mode == 'roundrobin':
+        pairs = [(a, b) for i, a in enumerate(names) for b in names[i + 1:]]
+    elif mode == 'gauntlet':
+        pairs = [(names[0], b) for b in names[1:]]
+    else:
+        raise ValueError("mode must be 'roundrobin' or 'gauntlet', not %r" % (mode,))
+    openings_per_pair = (games_per_pair + 1) // 2
+    games = []
+    for pair, (a, b) in enumerate(pairs):
+        for k in range(games_per_pair):
+            white, black = (a, b) if k % 2 == 0 else (b, a)
+            games.append((len(games), white, black, pair * openings_per_pair + k // 2))
+    return games
+
+
+def random_opening(game, plies, seed):
+    """
+    Plays plies random moves on game, reproducibly for a seed, and returns them. Stops early if the game ends.
+    """
+    rng = random.Random(seed)
+    moves = []
+    for _ in range(plies):
+        legal = game.return_legal_moves()
+        if not legal or game.draw_reason() is not None:
+            break
+        move = rng.choice(legal)
+        game.push(move)
+        moves.append(move)
+    return moves
+
+
+def play_match(white, black, opening_plies=0, opening_seed=0, max_plies=MAX_PLIES):
+    """
+    Plays one game between two agents after a random opening.
+    Returns a dict with the moves, the score for White (1, 0.5 or 0, None if cut off at max_plies) and how it ended.
+    """
+    game = ChessGame()
+    moves = random_opening(game, opening_plies, opening_seed)
+    agents = {'White': white, 'Black': black}
+    termination = 'max_plies'
+    while len(moves) < max_plies:
+        outcome = game.outcome()
+        if outcome is not None:
+            termination = outcome
+            break
+        move = tuple(int(v) for v in agents[game.to_move](game))
+        game.push(move)
+        moves.append(move)
+    if termination == CHECKMATE:
+        score = 0.0 if game.to_move == 'White' else 1.0
+    elif termination == 'max_plies':
+        score = None
+    else:
+        score = 0.5
+    return {'moves': moves, 'score': score, 'termination': termination}
+
+
+# Agents of a worker process, set once by _init_worker so they are not sent with every game.
+_agents = None
+
+
+def _init_worker(agents):
+    global _agents
+    _agents = agents
+
+
+def _play_scheduled(task):
+    index, white, black, opening, opening_plies, seed, max_plies = task
+    start = time.perf_counter()
+    record = play_match(_agents[white], _agents[black], opening_plies, seed * 1000003 + opening, max_plies)
+    return {'game': index, 'white': white, 'black': black, 'score': record['score'],
+            'termination': record['termination'], 'plies': len(record['moves']),
+            'seconds': time.perf_counter() - start, 'moves': ' '.join(move_to_uci(move) for move in record['moves'])}
+
+
+def read_results(path):
+    """
+    Returns the game records already written to a results file, keyed by game index. A last line cut off by an
+    interrupted run is ignored.
+    """
+    results = {}
+    if path is None or not os.path.exists(path):
+        return results
+    with open(path) as lines:
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            results[record['game']] = record
+    return results
+
+
+def _drop_partial_line(path):
+    """
+    Truncates a results file after its last complete line, so appended records start on a line of their own.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as handle:
+        data = handle.read()
+        if data and not data.endswith(b'\n'):
+            handle.truncate(data.rfind(b'\n') + 1)
+
+
+def run_tournament(agents, games_per_pair=2, mode='roundrobin', workers=None, opening_plies=4, seed=0,
+                   max_plies=MAX_PLIES, output=None, on_result=None):
+    '''
+    Plays a tournament and returns the records of all its games.
+    agents: dict of name -> agent, a callable ChessGame -> move; it must be picklable to run in worker processes
+    games_per_pair, mode: see schedule()
+    workers: number of worker processes, default all cores; 1 plays in this process
+    opening_plies: random moves played before the agents take over, seeded from seed and the opening number
+    max_plies: games still going after this many plies are not scored
+    output: JSON lines file each finished game is appended to; games already in it are not played again, so an
+            interrupted tournament is resumed by running it again with the same arguments
+    on_result: optional callable given each new game record as it arrives
+    '''
+    names = list(agents)
+    games = schedule(names, games_per_pair, mode)
+    results = read_results(output)
+    for record in results.values():
+        index = record['game']
+        if index >= len(games) or games[index][1:3] != (record['white'], record['black']):
+            raise ValueError("%s holds game %d between %s and %s, which is not in this tournament" % (
+                output, index, record['white'], record['black']))
+    tasks = [(index, white, black, opening, opening_plies, seed, max_plies)
+             for index, white, black, opening in games if index not in results]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    handle = None
+    if output:
+        _drop_partial_line(output)
+        handle = open(output, 'a')
+    pool = None
+    try:
+        if workers > 1 and len(tasks) > 1:
+            pool = mp.Pool(min(workers, len(tasks)), initializer=_init_worker, initargs=(agents,))
+            finished = pool.imap_unordered(_play_scheduled, tasks)
+        else:
+            _init_worker(agents)
+            finished = map(_play_scheduled, tasks)
+        for record in finished:
+            results[record['game']] = record
+            if handle is not None:
+                handle.write(json.dumps(record) + '\n')
+                handle.flush()
+            if on_result is not None:
+                on_result(record)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if handle is not None:
+            handle.close()
+    return [results[index] for index in sorted(results)]
+
+
+def standings(names, records):
+    """
+    Returns the wins, draws and losses of every agent and of every pair, as dicts
+    name -> [W, D, L] and (name, opponent) -> [W, D, L]. Unscored games are left out.
+    """
+    totals = {name: [0, 0, 0] for name in names}
+    pairs = {}
+    for record in records:
+        if record['score'] is None:
+            continue
+        for name, opponent, score in ((record['white'], record['black'], record['score']),
+                                      (record['black'], record['white'], 1 - record['score'])):
+            column = 0 if score == 1 else 1 if score == 0.5 else 2
+            totals[name][column] += 1
+            pairs.setdefault((name, opponent), [0, 0, 0])[column] += 1
+    return totals, pairs
+
+
+def fit_elo(names, records, iterations=200):
+    """
+    Returns the maximum likelihood Elo rating of each agent under the Bradley-Terry model, with draws counted as
+    half a win each, shifted so the ratings average zero.
+    Every pair that met is given one extra drawn game, so an agent that won or lost everything still gets a
+    finite rating.
+    """
+    index = {name: k for k, name in enumerate(names)}
+    n = len(names)
+    wins = np.zeros((n, n))
+    for record in records:
+        if record['score'] is None:
+            continue
+        w, b = index[record['white']], index[record['black']]
+        wins[w, b] += record['score']
+        wins[b, w] += 1 - record['score']
+    played = wins + wins.T
+    met = played > 0
+    wins += 0.5 * met
+    played += met
+    strength = np.ones(n)
+    total_wins = wins.sum(axis=1)
+    for _ in range(iterations):
+        denominator = (played / (strength[:, None] + strength[None, :])).sum(axis=1)
+        strength = np.where(denominator > 0, total_wins / np.maximum(denominator, 1e-12), strength)
+        strength /= np.exp(np.log(strength).mean())
+    ratings = 400 * np.log10(strength)
+    return ratings - ratings.mean()
+
+
+def elo_intervals(names, records, samples=200, seed=0):
+    """
+    Returns (ratings, low, high): fit_elo ratings with 95% confidence intervals from resampling the games.
+    """
+    scored = [record for record in records if record['score'] is not None]
+    ratings = fit_elo(names, scored)
+    if not scored:
+        return ratings, ratings, ratings
+    rng = np.random.default_rng(seed)
+    draws = np.array([fit_elo(names, [scored[k] for k in rng.integers(len(scored), size=len(scored))])
+                      for _ in range(samples)])
+    low, high = np.percentile(draws, [2.5, 97.5], axis=0)
+    return ratings, low, high
+
+
+def report(names, records):
+    """
+    Returns the tournament table as text: Elo with its 95% interval, W/D/L and score of each agent, then the W/D/L
+    of every pair.
+    """
+    totals, pairs = standings(names, records)
+    ratings, low, high = elo_intervals(names, records)
+    width = max(len(name) for name in names)
+    lines = ["%-*s %7s %17s %5s %5s %5s %5s %7s" % (width, 'agent', 'elo', '95% interval', 'games', 'W', 'D', 'L',
+                                                    'score')]
+    for k in sorted(range(len(names)), key=lambda k: -ratings[k]):
+        w, d, l = totals[names[k]]
+        games = w + d + l
+        score = (w + 0.5 * d) / games if games else 0.0
+        lines.append("%-*s %7.0f [%7.0f, %7.0f] %5d %5d %5d %5d %6.1f%%" % (width, names[k], ratings[k], low[k],
+                                                                          high[k], games, w, d, l, 100 * score))
+    lines.append('')
+    for (name, opponent), (w, d, l) in sorted(pairs.items()):
+        if names.index(name) < names.index(opponent):
+            lines.append("%-*s vs %-*s  +%d =%d -%d" % (width, name, width, opponent, w, d, l))
+    unscored = sum(record['score'] is None for record in records)
+    if unscored:
+        lines.append("%d games reached the ply limit and are not scored" % unscored)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play a tournament between agents and rate them.")
+    parser.add_argument('agents', nargs='+', help="agents: random, alphabeta[:depth] or mcts[:simulations]")
+    parser.add_argument('--mode', choices=('roundrobin', 'gauntlet'), default='roundrobin',
+                        help="gauntlet plays the first agent against each of the others")
+    parser.add_argument('--games-per-pair', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument('--opening-plies', type=int, default=4, help="random moves played before the agents")
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="JSON lines file to stream results to and resume from")
+    args = parser.parse_args(argv)
+    if len(set(args.agents)) != len(args.agents):
+        parser.error("agents must be unique")
+
+    agents = {spec: make_agent(spec) for spec in args.agents}
+    finished = []
+
+    def progress(record):
+        finished.append(record)
+        result = {1.0: '1-0', 0.0: '0-1', 0.5: '1/2-1/2'}.get(record['score'], '*')
+        print("game %d: %s - %s %s (%s, %d plies)" % (record['game'] + 1, record['white'], record['black'], result,
+                                                      record['termination'], record['plies']))
+
+    start = time.perf_counter()
+    records = run_tournament(agents, args.games_per_pair, args.mode, args.workers, args.opening_plies, args.seed,
+                             args.max_plies, args.output, progress)
+    elapsed = time.perf_counter() - start
+    print()
+    print(report(args.agents, records))
+    print("%d games played in %.1fs (%.2f games/s)" % (len(finished), elapsed, len(finished) / max(elapsed, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
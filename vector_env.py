@@ -0,0 +1,163 @@
+import numpy as np
+from chess import CHECKMATE, STALEMATE, ChessGame
+
+# Actions are indexed from square * 64 + to square, with squares numbered row * 8 + col.
+ACTION_SIZE = 64 * 64
+
+
+def encode_move(move):
+    """
+    Returns the action index of a move given as (from row, from col, to row, to col).
+    """
+    return (move[0] * 8 + move[1]) * 64 + move[2] * 8 + move[3]
+
+
+def decode_action(action):
+    """
+    Returns the move (from row, from col, to row, to col) of an action index.
+    """
+    from_sq, to_sq = divmod(int(action), 64)
+    return from_sq // 8, from_sq % 8, to_sq // 8, to_sq % 8
+
+
+class VectorChessEnv:
+    """
+    Runs num_envs games of chess in lockstep.
+    The boards are held in one (num_envs, 8, 8) array, and each ChessGame works on a view of its row, so the batch
+    is always up to date without copying. Side to move, castling rights and en passant state are mirrored into
+    parallel arrays after every step.
+    """
+
+    def __init__(self, num_envs, max_plies=None, auto_reset=True, transposition_table=None):
+        '''
+        num_envs: number of games to run
+        max_plies: games are stopped as drawn after this many plies, None for no limit
+        auto_reset: start a new game in an environment as soon as its game ends; without it, a finished
+                    environment must be restarted with reset_env() before the next step()
+        transposition_table: optional TranspositionTable shared by every game
+        '''
+        self.num_envs = num_envs
+        self.max_plies = max_plies
+        self.auto_reset = auto_reset
+        self.transposition_table = transposition_table
+
+        self.boards = np.zeros((num_envs, 8, 8), dtype=int)
+        self.white_to_move = np.ones(num_envs, dtype=bool)
+        # (white short, white long, black short, black long) for each game.
+        self.castling = np.ones((num_envs, 4), dtype=bool)
+        self.en_passant = np.zeros((num_envs, 2), dtype=int)
+        self.plies = np.zeros(num_envs, dtype=int)
+        # Games that ended and have not been restarted, only ever set without auto_reset.
+        self.done = np.zeros(num_envs, dtype=bool)
+        self.games = [None] * num_envs
+        # Legal moves of each game, computed on demand and cleared when the game changes.
+        self._legal_moves = [None] * num_envs
+        self.reset()
+
+    def _reset_env(self, k):
+        game = ChessGame(self.transposition_table)
+        self.boards[k] = game.board
+        game.board = self.boards[k]
+        self.games[k] = game
+        self._legal_moves[k] = None
+        self.plies[k] = 0
+        self.done[k] = False
+        self._sync(k)
+
+    def _sync(self, k):
+        game = self.games[k]
+        self.white_to_move[k] = game.to_move == 'White'
+        self.castling[k] = game.castling_rights()
+        self.en_passant[k] = game.en_passant
+
+    def legal_moves(self, k):
+        """
+        Returns the legal moves of game k.
+        """
+        if self._legal_moves[k] is None:
+            self._legal_moves[k] = self.games[k].return_legal_moves()
+        return self._legal_moves[k]
+
+    def reset(self):
+        """
+        Starts a new game in every environment and returns the boards.
+        """
+        for k in range(self.num_envs):
+            self._reset_env(k)
+        return self.boards.copy()
+
+    def reset_env(self, k):
+        """
+        Starts a new game in environment k only and returns its board.
+        """
+        self._reset_env(k)
+        return self.boards[k].copy()
+
+    def legal_action_mask(self):
+        """
+        Returns a (num_envs, ACTION_SIZE) boolean array marking the legal actions of every game.
+        """
+        env_index = []
+        actions = []
+        for k in range(self.num_envs):
+            moves = self.legal_moves(k)
+            env_index.extend([k] * len(moves))
+            actions.extend(encode_move(move) for move in moves)
+        mask = np.zeros((self.num_envs, ACTION_SIZE), dtype=bool)
+        mask[env_index, actions] = True
+        return mask
+
+    def step(self, actions):
+        """
+        Plays one action in every game.
+        Returns (boards, rewards, dones, info). The reward is 1 for the player who just moved if they gave
+        checkmate and 0 otherwise. info['winner'] is 1 for a White win, -1 for a Black win and 0 otherwise,
+        info['plies'] is the length of each game that just ended and info['termination'] how it ended (one of the
+        terminations of ChessGame.outcome() or 'max_plies'), or None for games that go on.
+        With auto_reset, games that ended are restarted and their returned board is the new starting position.
+        Without it, stepping a game that already ended raises ValueError; restart it with reset_env() first.
+        """
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_envs,):
+            raise ValueError("expected %d actions, got shape %s" % (self.num_envs, actions.shape))
+        finished = np.flatnonzero(self.done)
+        if len(finished):
+            raise ValueError("environment %d has finished, restart it with reset_env()" % finished[0])
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        winner = np.zeros(self.num_envs, dtype=np.int8)
+        plies = np.zeros(self.num_envs, dtype=int)
+        terminations = [None] * self.num_envs
+
+        for k in range(self.num_envs):
+            move = decode_action(actions[k])
+            if move not in self.legal_moves(k):
+                raise ValueError("illegal action %d (%s) in environment %d" % (actions[k], move, k))
+            game = self.games[k]
+            game.push(move)
+            self._legal_moves[k] = None
+            self.plies[k] += 1
+
+            if not self.legal_moves(k):
+                dones[k] = True
+                if game.in_check(game.to_move):
+                    terminations[k] = CHECKMATE
+                    rewards[k] = 1.0
+                    winner[k] = -1 if game.to_move == 'White' else 1
+                else:
+                    terminations[k] = STALEMATE
+            else:
+                terminations[k] = game.draw_reason()
+                if terminations[k] is None and self.max_plies is not None and self.plies[k] >= self.max_plies:
+                    terminations[k] = 'max_plies'
+                dones[k] = terminations[k] is not None
+
+            if dones[k]:
+                plies[k] = self.plies[k]
+                if self.auto_reset:
+                    self._reset_env(k)
+                    continue
+                self.done[k] = True
+            self._sync(k)
+
+        return self.boards.copy(), rewards, dones, {'winner': winner, 'plies': plies, 'termination': terminations}